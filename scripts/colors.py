@@ -5,52 +5,230 @@ Tmux pattern matcher - highlights URLs, paths, IPs, etc. and copies selection to
 Uses a pane swap approach: creates a hidden window with the selection UI, then swaps it
 with the original pane for a seamless transition (no visual flash from alternate screen).
 
-Usage: bind-key s run-shell "python3 ~/.config/scripts/colors.py"
+Usage: bind-key s run-shell "python3 ~/.config/scripts/colors.py --pane '#{pane_id}' --cursor '#{cursor_x},#{cursor_y}'"
+
+Add --scrollback to search the pane history as well, one screen at a time (Ctrl+U/Ctrl+D page),
+or --window to label every visible pane in the window at once. --progressive shows the capture
+straight away and adds labels as matching finishes, URLs and paths first.
+
+Typing a label selects its match (Shift: also insert it into the pane). Typing it with Alt
+held marks it instead and keeps the overlay open; Enter then picks everything marked, copied
+(or inserted) together, separated by spaces.
+
+Optionally start `colors.py --daemon` once (e.g. `run -b` in tmux.conf): the binding then hands
+the pane to the warm daemon over a Unix socket instead of doing the work itself.
+
+Only warnings and errors go to /tmp/colors.log by default. --trace FILE (or $COLORS_TRACE) turns
+on DEBUG logging and appends timing spans (start-up, tmux calls, capture, match, label, first
+paint, each key to redraw) to FILE as Chrome-trace JSON, for chrome://tracing or Perfetto.
 """
 import argparse
-import base64
+import atexit
+import bisect
+import codecs
+import contextlib
+import errno
+import fcntl
+import hashlib
+import heapq
+import itertools
+import json
 import logging
+import marshal
 import os
+import queue
 import re
+import select
+import shlex
+import shutil
+import socket
 import subprocess
 import sys
 import termios
+import threading
+import time
+import tempfile
 import tty
+import unicodedata
+from collections import namedtuple
+
+import escapes
 
-# Setup logging
+# Setup logging: warnings and errors only (the file is opened on first use) unless tracing
 logging.basicConfig(
-    filename="/tmp/colors.log",
-    level=logging.DEBUG,
+    handlers=[logging.FileHandler("/tmp/colors.log", delay=True)],
+    level=logging.WARNING,
     format="%(asctime)s - %(levelname)s - %(message)s",
 )
 log = logging.getLogger(__name__)
 
+# When the module body started running, i.e. the end of interpreter start-up
+MODULE_START_NS = time.time_ns()
+
 # ANSI escape sequences
 GREEN = "\033[32m"
 BRIGHT_YELLOW = "\033[1;93m"
 MATCH_BG = "\033[48;5;240m"
+MARKED_BG = "\033[48;5;22m"
+MARKED_TEXT = "\033[97m"
 RESET = "\033[0m"
 CLEAR_SCREEN = "\033[2J"
 HOME = "\033[H"
+MOVE_TO = "\033[{};{}H"  # Absolute cursor position (1-based row, column)
 HIDE_CURSOR = "\033[?25l"
 SHOW_CURSOR = "\033[?25h"
 
 # Label characters (home row priority)
 LABELS = "asdfqwerzxcvjklmiuopghtybn"
 
+# Input: how long a lone ESC waits to see if a sequence follows, and the sequences parsed
+ESCAPE_TIMEOUT = 0.025
+CSI_SEQUENCE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]')
+PASTE_START = "\x1b[200~"
+PASTE_END = "\x1b[201~"
+SS3_FINALS = "ABCDHFPQRS"  # ESC O + one of these: arrows, Home/End, F1-F4; anything else is Alt+Shift+O
+
+# Scrollback mode paging keys (vi-style half-page keys, as labels use every letter)
+PAGE_OLDER = "\x15"  # Ctrl+U
+PAGE_NEWER = "\x04"  # Ctrl+D
+
+# Multi-select: Alt+label marks a match, Enter (or a plain label) picks everything marked
+MULTI_SEPARATOR = " "
+
+# Recently selected texts, used to hand out the shortest labels
+STATE_DIR = os.path.join(os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state"), "colors")
+FRECENCY_FILE = os.path.join(STATE_DIR, "frecency.json")
+FRECENCY_HALF_LIFE = 7 * 24 * 3600  # Seconds for a selection's weight to halve
+FRECENCY_MAX_ENTRIES = 200
+
+# Progressive mode matches in stages, cheapest and most often picked patterns (URLs, paths) first
+PROGRESSIVE_STAGES = [(0, 1), (2, 3, 4, 5, 6)]
+
+# Per-line match cache in the runtime directory: least recently used lines go first
+MATCH_CACHE_NAME = "match-cache"
+MATCH_CACHE_MAX_BYTES = 512 * 1024  # Rough cap on the cache file, which every one-shot run loads
+MATCH_CACHE_TOUCH_INTERVAL = 60  # Seconds before a cache hit alone is worth writing back
+
+# How long the parent waits for the child to open the handoff pipe
+HANDOFF_TIMEOUT = 5.0
+
+# Tracing (--trace or $COLORS_TRACE): Chrome-trace JSON events appended to one file
+TRACE_ENV = "COLORS_TRACE"
+
+# Daemon mode: how long a trigger waits for a reply, and what the placeholder pane runs
+DAEMON_TIMEOUT = 5.0
+PLACEHOLDER_COMMAND = "tail -f /dev/null"  # Never exits, and never reads the pane's input
+
 # Pattern to match ANSI escape sequences
 ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
+# SGR parameters that clear all attributes before applying the rest
+SGR_RESETS = ("", "0")
 
 # Patterns to match (ordered from most specific to least specific)
 PATTERNS = [
     r'https?://[^\s<>"{}|\\^`\[\]]+',  # URLs
     r'(?:/|\.\.?/)[^\s:]+',  # File paths
-    r'(?:(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}|(?:[0-9a-fA-F]{1,4}:){1,7}:|(?:[0-9a-fA-F]{1,4}:){1,6}:[0-9a-fA-F]{1,4}|(?:[0-9a-fA-F]{1,4}:){1,5}(?::[0-9a-fA-F]{1,4}){1,2}|(?:[0-9a-fA-F]{1,4}:){1,4}(?::[0-9a-fA-F]{1,4}){1,3}|(?:[0-9a-fA-F]{1,4}:){1,3}(?::[0-9a-fA-F]{1,4}){1,4}|(?:[0-9a-fA-F]{1,4}:){1,2}(?::[0-9a-fA-F]{1,4}){1,5}|[0-9a-fA-F]{1,4}:(?::[0-9a-fA-F]{1,4}){1,6}|:(?::[0-9a-fA-F]{1,4}){1,7}|::)',  # IPv6
+    # The leading lookahead lets only positions near a ':' into the full IPv6 expression
+    r'(?=[0-9a-fA-F]{0,4}:)(?:(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}|(?:[0-9a-fA-F]{1,4}:){1,7}:|(?:[0-9a-fA-F]{1,4}:){1,6}:[0-9a-fA-F]{1,4}|(?:[0-9a-fA-F]{1,4}:){1,5}(?::[0-9a-fA-F]{1,4}){1,2}|(?:[0-9a-fA-F]{1,4}:){1,4}(?::[0-9a-fA-F]{1,4}){1,3}|(?:[0-9a-fA-F]{1,4}:){1,3}(?::[0-9a-fA-F]{1,4}){1,4}|(?:[0-9a-fA-F]{1,4}:){1,2}(?::[0-9a-fA-F]{1,4}){1,5}|[0-9a-fA-F]{1,4}:(?::[0-9a-fA-F]{1,4}){1,6}|:(?::[0-9a-fA-F]{1,4}){1,7}|::)',  # IPv6
     r'\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b',  # IPv4
     r'\bv\d+\.\d+\.\d+(?:-[\w.]+)?(?:\+[\w.]+)?\b',  # Semantic versions
-    r'(?<![a-fA-F0-9])[0-9a-f]{7,40}(?![a-fA-F0-9])',  # Git hashes
+    # Starting on the first hex digit (then looking behind it) lets the engine skip ahead to candidates
+    r'[0-9a-f](?<![a-fA-F0-9][0-9a-f])[0-9a-f]{6,39}(?![a-fA-F0-9])',  # Git hashes
     r'\b\d{3,}\b',  # Numbers (3+ digits)
 ]
+COMPILED_PATTERNS = [re.compile(pattern) for pattern in PATTERNS]
+
+# A literal that every match of the corresponding pattern contains (None: nothing cheap to
+# test for). No pattern matches across a newline, so each only has to scan the lines that
+# hold its literal; finding those is a fast literal search.
+PATTERN_LITERALS = ["://", "/", ":", ".", "v", None, None]
+LINES_WITH = {literal: re.compile(re.escape(literal) + r"[^\n]*") for literal in PATTERN_LITERALS if literal}
+
+
+class Tracer:
+    """Collects timed spans and appends them to a Chrome-trace JSON file.
+
+    Every process appends to the same file, which is a JSON array left open at the end
+    (the trace viewers accept that), so parent, child and daemon end up in one trace.
+    """
+
+    def __init__(self, path: str, process_name: str):
+        self.path = path
+        self.events: list[dict] = [
+            {"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": process_name}},
+        ]
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, args: dict):
+        start = time.time_ns()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time_ns(), args)
+
+    def add(self, name: str, start_ns: int, end_ns: int, args: dict | None = None):
+        """Record a complete span; timestamps are nanoseconds since the epoch."""
+        self.events.append({
+            "name": name, "ph": "X", "ts": start_ns / 1000, "dur": (end_ns - start_ns) / 1000,
+            "pid": os.getpid(), "tid": threading.get_native_id(), "args": args or {},
+        })
+
+    def flush(self):
+        """Append the collected events to the trace file with a single write."""
+        with self.lock:
+            events, self.events = self.events, []
+        if not events:
+            return
+        with contextlib.suppress(FileExistsError):
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            os.write(fd, b"[\n")
+            os.close(fd)
+        data = "".join(json.dumps(event) + ",\n" for event in events).encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+
+tracer: Tracer | None = None
+NO_SPAN = contextlib.nullcontext()
+
+
+def span(name, **args):
+    """Time the enclosed block as name when tracing is on; a shared no-op otherwise."""
+    if tracer is None:
+        return NO_SPAN
+    return tracer.span(name, args)
+
+
+def process_start_ns():
+    """Return when this process started (ns since the epoch) from /proc, or None.
+
+    The kernel records the start in clock ticks, so this is only good to ~10ms.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        since_boot_ns = time.clock_gettime_ns(time.CLOCK_BOOTTIME)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+    started_ns = start_ticks * 1_000_000_000 // os.sysconf("SC_CLK_TCK")
+    return time.time_ns() - (since_boot_ns - started_ns)
+
+
+def enable_tracing(path, process_name):
+    """Turn on DEBUG logging and span collection, written to path at exit."""
+    global tracer
+    logging.getLogger().setLevel(logging.DEBUG)
+    tracer = Tracer(path, process_name)
+    started = process_start_ns()
+    if started is not None and started < MODULE_START_NS:
+        tracer.add("interpreter start", started, MODULE_START_NS)
+    tracer.add("import", MODULE_START_NS, time.time_ns())
+    atexit.register(tracer.flush)
+    log.debug(f"Tracing to {path}")
 
 
 class TTY:
@@ -61,6 +239,8 @@ class TTY:
         self.fd: int = -1
         self.old_settings: list | None = None
         self.in_raw_mode = False
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.buffer = ""  # Decoded input not yet split into keys
 
     def __enter__(self):
         self.fd = os.open(self.tty_path, os.O_RDWR | os.O_NOCTTY)
@@ -93,13 +273,83 @@ class TTY:
         """Write data to TTY."""
         os.write(self.fd, data.encode() if isinstance(data, str) else data)
 
-    def read_key(self) -> str:
-        """Read a single key from TTY."""
-        return os.read(self.fd, 1).decode()
+    def _fill(self, timeout: float | None = None, wake_fd: int | None = None) -> bool:
+        """Append whatever input is ready to the buffer, waiting up to timeout (None: forever).
+
+        Returns False if nothing arrived in time or wake_fd became readable first; raises
+        EOFError once the TTY is gone.
+        """
+        fds = [self.fd] if wake_fd is None else [self.fd, wake_fd]
+        ready, _, _ = select.select(fds, [], [], timeout)
+        if self.fd not in ready:
+            return False
+        data = os.read(self.fd, 4096)
+        if not data:
+            raise EOFError(f"{self.tty_path} closed")
+        self.buffer += self.decoder.decode(data)
+        return True
+
+    def _key_length(self, final: bool) -> int:
+        """Return the length of the key at the start of the buffer, or 0 if more input may complete it.
+
+        With final, nothing more is coming: a lone or unfinished escape is just ESC, and
+        ESC O alone is Alt+Shift+O.
+        """
+        buffer = self.buffer
+        if buffer[0] != "\x1b":
+            return 1
+        if len(buffer) == 1:
+            return 1 if final else 0
+        if buffer[1] == "[":
+            csi = CSI_SEQUENCE.match(buffer)
+            if csi is None:
+                return 1 if final else 0
+            if csi.group() == PASTE_START:
+                end = buffer.find(PASTE_END, csi.end())
+                if end >= 0:
+                    return end + len(PASTE_END)
+                return len(buffer) if final else 0
+            return csi.end()
+        if buffer[1] == "O":  # SS3, e.g. arrows in application mode
+            if len(buffer) >= 3 and buffer[2] in SS3_FINALS:
+                return 3
+            if len(buffer) == 2 and not final:
+                return 0
+        return 2  # Alt+key
+
+    def read_keys(self, wake_fd: int | None = None) -> list[str]:
+        """Block for input, then return every whole key available, so type-ahead comes as one batch.
+
+        Bursts are read a chunk at a time and decoded incrementally (UTF-8 may split across
+        reads). Escape sequences come back as one key each, an ESC with nothing after it
+        within ESCAPE_TIMEOUT as a lone "\x1b", and bracketed pastes as their characters.
+        Returns [] if wake_fd becomes readable while waiting for the first key.
+        """
+        while not self.buffer:
+            if not self._fill(wake_fd=wake_fd):
+                return []
+        while self._fill(0):
+            pass
+
+        keys = []
+        while self.buffer:
+            length = self._key_length(final=False)
+            if not length:
+                if self._fill(ESCAPE_TIMEOUT):
+                    continue
+                length = self._key_length(final=True)
+            key, self.buffer = self.buffer[:length], self.buffer[length:]
+            if key.startswith(PASTE_START):
+                keys.extend(key[len(PASTE_START):].removesuffix(PASTE_END))
+            else:
+                keys.append(key)
+        return keys
 
     def flush_input(self):
         """Flush any pending input."""
         termios.tcflush(self.fd, termios.TCIFLUSH)
+        self.decoder.reset()
+        self.buffer = ""
         log.debug("Flushed input")
 
     def enter_raw_mode(self):
@@ -130,15 +380,136 @@ class TTY:
         self.write(SHOW_CURSOR)
 
     def copy_to_clipboard(self, text):
-        """Copy text to system clipboard using OSC 52."""
-        encoded = base64.b64encode(text.encode()).decode()
-        self.write(f"\033]52;c;{encoded}\007")
+        """Copy text to system clipboard using OSC 52.
+
+        Not wrapped for passthrough: tmux (set-clipboard on) takes OSC 52 from a pane,
+        fills its own paste buffer and forwards it to the outer terminal.
+        """
+        escapes.write(self.fd, escapes.clipboard(text))
         log.info(f"Copied to clipboard: {text!r}")
 
 
-def tmux(*args):
+class TmuxControlError(Exception):
+    """The control-mode connection is unusable; callers fall back to one tmux process per command."""
+
+
+class TmuxControl:
+    """A `tmux -C` client attached to the _tmp session.
+
+    Commands are written as one batch and their replies read back from the
+    %begin/%end blocks, so a whole batch costs a single round trip.
+    """
+
+    def __init__(self):
+        # Attaching creates _tmp if needed; no-output keeps pane output off the pipe
+        self.proc = subprocess.Popen(
+            ["tmux", "-C", "new-session", "-A", "-s", "_tmp", ";", "refresh-client", "-f", "no-output"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def quote(arg):
+        """Quote arg for the tmux command parser."""
+        return "'" + arg.replace("'", "'\\''") + "'"
+
+    def run(self, *commands):
+        """Run commands (argument lists) in one batch. Returns [(ok, output)] in order."""
+        batch = "".join(" ".join(map(self.quote, command)) + "\n" for command in commands)
+        with self.lock:
+            try:
+                self.proc.stdin.write(batch.encode())
+                self.proc.stdin.flush()
+                return [self._read_reply() for _ in commands]
+            except (OSError, ValueError) as e:
+                raise TmuxControlError(f"control connection lost: {e}") from e
+
+    def _read_reply(self):
+        """Read up to the next reply block for one of our commands, skipping notifications."""
+        while True:
+            line = self._readline()
+            # %begin <time> <number> <flags>; flag 1 marks commands we sent
+            if line.startswith("%begin ") and int(line.split()[3]) & 1:
+                number = line.split()[2]
+                break
+
+        output = []
+        while True:
+            line = self._readline()
+            fields = line.split()
+            if len(fields) == 4 and fields[0] in ("%end", "%error") and fields[2] == number:
+                return fields[0] == "%end", "\n".join(output)
+            output.append(line)
+
+    def _readline(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise TmuxControlError("control client exited")
+        return line.decode(errors="replace").rstrip("\n")
+
+    def close(self):
+        """Detach the control client."""
+        with contextlib.suppress(OSError):
+            self.proc.stdin.close()
+        self.proc.wait()
+
+
+# Shared control connection, None when running one tmux process per command
+control: TmuxControl | None = None
+window_ids = itertools.count()
+
+
+def connect_control():
+    """Open the shared control connection if there is none; stay on subprocesses if it fails."""
+    global control
+    if control is None or control.proc.poll() is not None:
+        try:
+            control = TmuxControl()
+            log.debug("Opened tmux control connection")
+        except OSError as e:
+            log.error(f"tmux control mode unavailable: {e}")
+            control = None
+
+
+def tmux_batch(*commands, strip=True):
+    """Run several tmux commands (argument lists) and return their outputs.
+
+    Uses the control connection when it is open, otherwise one process per command.
+    Raises CalledProcessError for the first failed command. With strip=False only the
+    final newline is removed, so blank leading and trailing lines survive.
+    """
+    with span("tmux", commands=" ; ".join(command[0] for command in commands)):
+        outputs = run_tmux_commands(commands)
+    return [output.strip() for output in outputs] if strip else outputs
+
+
+def run_tmux_commands(commands):
+    """Run commands for tmux_batch, over the control connection if there is one."""
+    global control
+    outputs = None
+    if control is not None:
+        try:
+            replies = control.run(*commands)
+        except TmuxControlError as e:
+            log.error(f"{e}, falling back to tmux subprocesses")
+            control = None
+        else:
+            for command, (ok, output) in zip(commands, replies):
+                if not ok:
+                    raise subprocess.CalledProcessError(1, ["tmux", *command], output)
+            outputs = [output for _, output in replies]
+
+    if outputs is None:
+        outputs = [
+            subprocess.check_output(["tmux", *command]).decode().removesuffix("\n")
+            for command in commands
+        ]
+    return outputs
+
+
+def tmux(*args, strip=True):
     """Run tmux command and return output."""
-    return subprocess.check_output(["tmux", *args]).decode().strip()
+    return tmux_batch(args, strip=strip)[0]
 
 
 def strip_ansi(text):
@@ -147,277 +518,1266 @@ def strip_ansi(text):
 
 
 def generate_labels(count):
-    """Generate labels for the given count of matches."""
-    if count <= len(LABELS):
+    """Generate count prefix-free labels, shortest first."""
+    base = len(LABELS)
+    if count <= base:
         return list(LABELS[:count])
 
+    # Smallest depth whose full tree has room for count labels
+    depth = 1
+    while base ** depth < count:
+        depth += 1
+
+    # Keep as many labels one level up as possible, expand the rest one level deeper
+    short_count = (base ** depth - count) // (base - 1)
     labels = []
-    base = len(LABELS)
-    digits_needed = 1
-    while base ** digits_needed < count:
-        digits_needed += 1
-
-    for i in range(count):
-        label = ""
-        num = i
-        for _ in range(digits_needed):
-            label = LABELS[num % base] + label
-            num //= base
-        labels.append(label)
+    for prefix in itertools.product(LABELS, repeat=depth - 1):
+        prefix = "".join(prefix)
+        if len(labels) < short_count:
+            labels.append(prefix)
+            continue
+        for char in LABELS[:count - len(labels)]:
+            labels.append(prefix + char)
+        if len(labels) == count:
+            break
 
     return labels
 
 
+def allocate_labels(count, free, reserve=0):
+    """Take count labels from free, a list of unused prefix-free labels (best and shortest first).
+
+    Until count plus reserve fit, the last of the shortest free labels is split into its
+    LABELS extensions in place. Returns (labels, still free). Starting from list(LABELS)
+    with no reserve, this hands out the same labels as generate_labels(count).
+    """
+    free = list(free)
+    while len(free) < count + reserve:
+        # Split the tail of the shortest group in one go, or all of it and go on with the next
+        shortest = len(free[0])
+        group = sum(1 for _ in itertools.takewhile(lambda label: len(label) == shortest, free))
+        splits = min(group, -(-(count + reserve - len(free)) // (len(LABELS) - 1)))
+        free[group - splits:group] = [label + char for label in free[group - splits:group] for char in LABELS]
+    return free[:count], free[count:]
+
+
+def iter_line_runs(content, literal):
+    """Yield (start, end) of each run of consecutive lines containing literal, newlines included."""
+    run_start = run_end = -1
+    for line in LINES_WITH[literal].finditer(content):
+        line_start = content.rfind("\n", 0, line.start()) + 1
+        if line_start != run_end:
+            if run_end >= 0:
+                yield run_start, run_end
+            run_start = line_start
+        run_end = line.end() + 1
+    if run_end >= 0:
+        yield run_start, run_end
+
+
+def iter_pattern(pattern, content, literal=None):
+    """Yield pattern's matches in content, only scanning the lines that contain literal.
+
+    Each run of lines is scanned in place with pos/endpos, so lookbehinds and \\b still
+    see the text around it and the matches are exactly those of a full scan. When the
+    literal is about as common as lines are, there is little to skip and one full scan wins.
+    """
+    if literal is None or content.count(literal) > content.count("\n"):
+        yield from pattern.finditer(content)
+        return
+    for start, end in iter_line_runs(content, literal):
+        yield from pattern.finditer(content, start, end)
+
+
+def iter_matches(content, pattern_ids=None):
+    """Yield non-overlapping (start, end, text) matches in position order.
+
+    Every pattern is scanned lazily and the hits are merged by start, longest first,
+    so overlaps are dropped while scanning instead of after collecting and sorting.
+    pattern_ids limits the scan to those indices into PATTERNS.
+    """
+    if pattern_ids is None:
+        pattern_ids = range(len(PATTERNS))
+    hits = heapq.merge(*(
+        ((m.start(), m.start() - m.end(), m.end()) for m in iter_pattern(COMPILED_PATTERNS[idx], content, PATTERN_LITERALS[idx]))
+        for idx in pattern_ids
+    ))
+
+    last_end = -1
+    for start, _, end in hits:
+        if start >= last_end:
+            yield start, end, content[start:end]
+            last_end = end
+
+
 def find_patterns(content):
     """Find all patterns in content without overlapping matches."""
-    all_matches = []
+    with span("match", chars=len(content)):
+        return list(iter_matches(content))
 
-    for pattern in PATTERNS:
-        for m in re.finditer(pattern, content):
-            all_matches.append((m.start(), m.end(), m.group()))
 
-    # Sort by position, longer matches first for same start
-    all_matches.sort(key=lambda x: (x[0], -(x[1] - x[0])))
+class MatchCache:
+    """Match results per line, keyed by a hash of the line and shared on disk by every run.
 
-    # Remove overlapping matches
-    result = []
-    last_end = -1
-    for start, end, text in all_matches:
-        if start >= last_end:
-            result.append((start, end, text))
-            last_end = end
+    This relies on no pattern matching across a newline: each line's matches then only
+    depend on the line itself, and a capture's matches are its lines' matches laid end
+    to end. Entries are [last_used, (start, end, start, end, ...)] with offsets in the
+    line. The file records a digest of PATTERNS, so editing them starts a fresh cache.
+    """
 
-    return result
+    ENTRY_BYTES = 48  # Rough per-entry cost in the file, on top of its offsets
 
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.entries: dict[bytes, list] = self._read()
 
-def generate_labels_for_matches(matches):
-    """Generate labels for matches, with duplicate texts sharing the same label."""
-    text_to_label = {}
-    for _, _, text in matches:
-        if text not in text_to_label:
-            text_to_label[text] = generate_labels(len(text_to_label) + 1)[-1]
+    @staticmethod
+    def patterns_digest():
+        return hashlib.blake2b("\0".join(PATTERNS).encode(), digest_size=16).digest()
 
-    return [text_to_label[text] for _, _, text in matches]
+    def _read(self):
+        """Return the entries on disk, or none if the file is missing, damaged or stale."""
+        try:
+            with open(self.path, "rb") as f:
+                digest, entries = marshal.loads(f.read())  # marshal.load(f) reads in tiny chunks
+        except (OSError, ValueError, EOFError, TypeError):
+            return {}
+        return entries if digest == self.patterns_digest() and isinstance(entries, dict) else {}
+
+    def find_patterns(self, content):
+        """find_patterns(content), only scanning lines the cache has not seen."""
+        lines = content.split("\n")
+        keys = [hashlib.blake2b(line.encode(), digest_size=16).digest() for line in lines]
+        now = time.time()
+
+        # Hold on to the entries themselves, as save() may evict them from self.entries
+        with self.lock:
+            found = {key: self.entries.get(key) for key in keys}
+        missing = {key: line for key, line in zip(keys, lines) if found[key] is None}
+        if missing:
+            # Lines are independent, so the misses can be matched in one go
+            line_starts = list(itertools.accumulate((len(line) + 1 for line in missing.values()), initial=0))
+            offsets = [[] for _ in missing]
+            for start, end, _ in find_patterns("\n".join(missing.values())):
+                idx = bisect.bisect_right(line_starts, start) - 1
+                offsets[idx] += (start - line_starts[idx], end - line_starts[idx])
+            with self.lock:
+                for key, line_offsets in zip(missing, offsets):
+                    self.entries[key] = found[key] = [now, tuple(line_offsets)]
+                self.dirty = True
+
+        matches = []
+        line_start = 0
+        with self.lock:
+            for line, key in zip(lines, keys):
+                entry = found[key]
+                if now - entry[0] > MATCH_CACHE_TOUCH_INTERVAL:
+                    entry[0] = now
+                    self.dirty = True
+                offsets = entry[1]
+                for idx in range(0, len(offsets), 2):
+                    start, end = offsets[idx], offsets[idx + 1]
+                    matches.append((line_start + start, line_start + end, line[start:end]))
+                line_start += len(line) + 1
+        log.debug(f"Match cache: {len(lines) - len(missing)}/{len(lines)} lines cached")
+        return matches
+
+    def save(self):
+        """Merge with what other runs saved meanwhile, evict, and replace the file atomically.
+
+        The evicted entries are dropped from memory too, so a long-running daemon stays
+        within the same cap (plus whatever it matched since the last save).
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            entries = dict(self.entries)
+
+        with span("cache save", entries=len(entries)), open(f"{self.path}.lock", "a") as lock_file:
+            # Writers take turns; readers never wait, os.replace swaps the whole file in
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for key, entry in self._read().items():
+                if key not in entries or entry[0] > entries[key][0]:
+                    entries[key] = entry
+
+            kept = {}
+            size = 0
+            for key, entry in sorted(entries.items(), key=lambda item: item[1][0], reverse=True):
+                size += self.ENTRY_BYTES + 5 * len(entry[1])
+                if size > MATCH_CACHE_MAX_BYTES:
+                    break
+                kept[key] = entry
+
+            tmp_file = f"{self.path}.{os.getpid()}"
+            with open(tmp_file, "wb") as f:
+                f.write(marshal.dumps((self.patterns_digest(), kept)))
+            os.replace(tmp_file, self.path)
+        log.debug(f"Saved {len(kept)} of {len(entries)} match cache entries")
+
+        with self.lock:
+            # Keep lines matched while saving; the next save evicts among them
+            kept.update((key, entry) for key, entry in self.entries.items() if key not in entries)
+            self.entries = kept
+
+
+match_cache: MatchCache | None = None
+match_cache_lock = threading.Lock()
+
+
+def find_patterns_cached(content):
+    """find_patterns through the shared per-line match cache, loading it on first use."""
+    global match_cache
+    with match_cache_lock:
+        if match_cache is None:
+            with span("cache load"):
+                match_cache = MatchCache(os.path.join(runtime_dir(), MATCH_CACHE_NAME))
+    return match_cache.find_patterns(content)
+
+
+def save_match_cache():
+    """Write back the match cache if this process used it."""
+    if match_cache is not None:
+        try:
+            match_cache.save()
+        except OSError as e:
+            log.error(f"Failed to save match cache: {e}")
 
 
-def draw_screen(tty, colored_content, matches, labels):
-    """Draw the screen with highlighted matches and labels, preserving original colors."""
-    output = []
-    match_idx = 0
-    visual_pos = 0  # Position in plain text (ignoring ANSI codes)
-    i = 0  # Position in colored content
-
-    while i < len(colored_content):
-        # Check for ANSI escape sequence
-        ansi_match = ANSI_ESCAPE.match(colored_content, i)
-        if ansi_match:
-            output.append(ansi_match.group())
-            i = ansi_match.end()
-            continue
+def load_frecency():
+    """Return {text: score} for recently selected texts, decayed to now."""
+    try:
+        with open(FRECENCY_FILE) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-        # Check if we're at a match start
-        if match_idx < len(matches) and visual_pos == matches[match_idx][0]:
-            _, end, match_text = matches[match_idx]
-            label = labels[match_idx]
+    now = time.time()
+    return {
+        text: count * 0.5 ** ((now - last_used) / FRECENCY_HALF_LIFE)
+        for text, (count, last_used) in entries.items()
+    }
 
-            # Output the label with highlight
-            output.append(MATCH_BG + BRIGHT_YELLOW + label + RESET)
 
-            # Output rest of match with green highlight (if label is shorter)
-            if len(label) < len(match_text):
-                output.append(MATCH_BG + GREEN + match_text[len(label):] + RESET)
+def record_selection(texts):
+    """Bump each of texts in the frecency store, keeping only the strongest entries."""
+    try:
+        with open(FRECENCY_FILE) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+
+    now = time.time()
+    for text in texts:
+        count, _ = entries.get(text, (0, now))
+        entries[text] = (count + 1, now)
+
+    if len(entries) > FRECENCY_MAX_ENTRIES:
+        def score(item):
+            count, last_used = item[1]
+            return count * 0.5 ** ((now - last_used) / FRECENCY_HALF_LIFE)
+        entries = dict(sorted(entries.items(), key=score, reverse=True)[:FRECENCY_MAX_ENTRIES])
 
-            # Skip over the match in colored content (by visual chars)
-            chars_to_skip = len(match_text)
-            while chars_to_skip > 0 and i < len(colored_content):
-                skip_ansi = ANSI_ESCAPE.match(colored_content, i)
-                if skip_ansi:
-                    i = skip_ansi.end()
-                else:
-                    i += 1
-                    chars_to_skip -= 1
+    try:
+        # Selections include URLs with tokens and private paths, so only we may read them
+        os.makedirs(STATE_DIR, mode=0o700, exist_ok=True)
+        tmp_file = f"{FRECENCY_FILE}.{os.getpid()}"
+        with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_file, FRECENCY_FILE)
+    except OSError as e:
+        log.error(f"Failed to save frecency: {e}")
+
+
+def match_priority(matches, content, cursor=None, frecency=None):
+    """Return {text: sort key}, lower keys for recently selected texts and those nearest the cursor."""
+    frecency = frecency or {}
+    keys = {}
+    line = 0
+    line_start = 0
+    pos = 0
+
+    with span("priority", matches=len(matches)):
+        for start, _, text in matches:
+            newlines = content.count("\n", pos, start)
+            if newlines:
+                line += newlines
+                line_start = content.rfind("\n", pos, start) + 1
+            pos = start
+
+            if cursor:
+                cursor_x, cursor_y = cursor
+                distance = (abs(line - cursor_y), abs(start - line_start - cursor_x))
+            else:
+                distance = (0, 0)
+
+            key = (-frecency.get(text, 0.0), *distance)
+            if text not in keys or key < keys[text]:
+                keys[text] = key
+
+    return keys
+
+
+def generate_labels_for_matches(matches, priority=None):
+    """Generate labels for matches, with duplicate texts sharing the same label.
+
+    Texts are ordered by their priority key (see match_priority) so the most likely
+    picks get the shortest labels; without one they keep their on-screen order.
+    """
+    with span("label", matches=len(matches)):
+        texts = list(dict.fromkeys(text for _, _, text in matches))
+        if priority:
+            texts.sort(key=priority.__getitem__)
+
+        text_to_label = dict(zip(texts, generate_labels(len(texts))))
+        return [text_to_label[text] for _, _, text in matches]
+
+
+def highlight(label, match_text, marked=False):
+    """Return the label plus the rest of the match, highlighted (differently once marked)."""
+    background, text_color = (MARKED_BG, MARKED_TEXT) if marked else (MATCH_BG, GREEN)
+    output = background + BRIGHT_YELLOW + label + RESET
+    if len(label) < len(match_text):
+        output += background + text_color + match_text[len(label):] + RESET
+    return output
+
+
+def display_width(text):
+    """Return how many terminal columns text takes: wide characters two, combining ones none."""
+    if text.isascii():
+        return len(text)
+    return sum(
+        0 if unicodedata.combining(char) else 2 if unicodedata.east_asian_width(char) in "WF" else 1
+        for char in text
+    )
 
-            visual_pos = end
-            match_idx += 1
-            continue
 
-        # Regular character, copy it
-        output.append(colored_content[i])
-        i += 1
-        visual_pos += 1
+def highlight_width(label, match_text):
+    """Return the columns highlight(label, match_text) takes on screen."""
+    return len(label) + display_width(match_text[len(label):])
+
+
+# Where a match sits on screen (col in terminal columns) and in the coloured capture
+Cell = namedtuple("Cell", "row col width text raw_start raw_end run end_run")
+
+
+class Frame:
+    """What draw_screen last put on the TTY, so later frames only repaint labels that changed.
+
+    The coloured capture is parsed once into cells mapping each match's visual
+    position to its raw offsets, so painting copies the text between matches as slices.
+    """
+
+    def __init__(self, colored_content, matches):
+        self.colored_content = colored_content
+        self.painted: dict[int, tuple] | None = None  # Match start -> (label, marked) on screen
+        self.cells: dict[int, Cell] = {}  # Match start -> Cell
+
+        # Offset map: plain run k starts at visual run_visual[k] and raw run_raw[k]
+        run_visual = [0]
+        run_raw = [0]
+        sgr_escapes = []  # Escape k ends right before run k + 1
+        last_reset = []  # Index of the latest reset escape at or before escape k
+        visual_pos = 0
+        reset_idx = 0
+        for idx, escape in enumerate(ANSI_ESCAPE.finditer(colored_content)):
+            visual_pos += escape.start() - run_raw[-1]
+            run_visual.append(visual_pos)
+            run_raw.append(escape.end())
+            text = escape.group()
+            sgr_escapes.append(text)
+            if text[2:-1].partition(";")[0] in SGR_RESETS:
+                reset_idx = idx
+            last_reset.append(reset_idx)
+
+        self.run_visual = run_visual
+        self.run_raw = run_raw
+        self.sgr_escapes = sgr_escapes
+        self.last_reset = last_reset
+        self.plain_content = strip_ansi(colored_content)
+        self.add_matches(matches)
+
+    def raw_index(self, visual):
+        """Return (run, raw index) of visual position, after any escapes sitting there."""
+        run = bisect.bisect_right(self.run_visual, visual) - 1
+        return run, self.run_raw[run] + visual - self.run_visual[run]
+
+    def add_matches(self, matches):
+        """Map matches (in position order) to cells, e.g. as progressive mode finds them."""
+        plain_content = self.plain_content
+        row = 0
+        col = 0
+        pos = 0  # col is the screen column of pos
+        for start, end, text in matches:
+            newlines = plain_content.count("\n", pos, start)
+            if newlines:
+                row += newlines
+                pos = plain_content.rfind("\n", pos, start) + 1
+                col = 0
+            col += display_width(plain_content[pos:start])
+            pos = start
+
+            run, raw_start = self.raw_index(start)
+            end_run, raw_end = self.raw_index(end - 1)
+            self.cells[start] = Cell(row, col, display_width(text), text, raw_start, raw_end + 1, run, end_run)
+
+    def state(self, run):
+        """Return the escapes in effect at the start of run, from the latest reset on."""
+        return "".join(self.sgr_escapes[self.last_reset[run - 1]:run]) if run else ""
+
+    def original(self, cell):
+        """Return the coloured text that restores cell, with the escapes in effect at its start."""
+        return RESET + self.state(cell.run) + self.colored_content[cell.raw_start:cell.raw_end] + RESET
+
+    def highlighted(self, cell, label, marked=False):
+        """Return cell highlighted with label, then the escapes in effect after it for the text that follows."""
+        return RESET + self.state(cell.run) + highlight(label, cell.text, marked) + self.state(cell.end_run)
+
+
+def draw_screen(tty, frame, matches, labels, marked=()):
+    """Draw the screen with highlighted matches and labels, preserving original colors.
+
+    The first call paints the whole capture; later calls only rewrite the match cells
+    whose label (or marked state) changed since the previous frame. Matches whose text
+    is in marked are drawn as marked.
+    """
+    wanted = {start: (label, text in marked) for (start, _, text), label in zip(matches, labels)}
+    painted = frame.painted
+
+    # Labels longer than their match, or over wide characters, shift the rest of the line
+    overflow = painted is not None and any(
+        highlight_width(label, frame.cells[start].text) != frame.cells[start].width
+        for start, (label, _) in itertools.chain(painted.items(), wanted.items())
+    )
+    if painted is not None and not overflow:
+        output = []
+        for start in painted.keys() | wanted.keys():
+            shown = wanted.get(start)
+            if shown == painted.get(start):
+                continue
+            cell = frame.cells[start]
+            output.append(MOVE_TO.format(cell.row + 1, cell.col + 1))
+            output.append(frame.highlighted(cell, *shown) if shown else frame.original(cell))
+        tty.write("".join(output) + RESET + HOME)
+        frame.painted = wanted
+        return
+
+    # Full paint: copy the unchanged runs between matches as slices
+    colored_content = frame.colored_content
+    output = []
+    raw_pos = 0
+    for (start, _, match_text), label in zip(matches, labels):
+        cell = frame.cells[start]
+        output.append(colored_content[raw_pos:cell.raw_start])
+        output.append(frame.highlighted(cell, label, match_text in marked))
+        raw_pos = cell.raw_end
+    output.append(colored_content[raw_pos:])
 
     tty.clear_and_home()
     tty.write("".join(output).replace("\n", "\n\r"))
     tty.write(RESET + HOME)
+    frame.painted = wanted
+
+
+class PageRequest(Exception):
+    """Raised by select_match when the user pages to another scrollback viewport."""
+
+    def __init__(self, step):
+        super().__init__(step)
+        self.step = step  # +1 = older, -1 = newer
+
+
+def iter_progressive_labels(plain_content, cursor=None):
+    """Yield (matches, labels) for each of PROGRESSIVE_STAGES that finds something.
+
+    Labels never change once yielded: each stage takes prefix-free labels that earlier
+    stages left free, and a free prefix is kept back while stages remain. A match that
+    overlaps one from an earlier stage is dropped, so in those (rare) spots the result can
+    differ from find_patterns, which keeps whichever starts first or is longer.
+    """
+    frecency = load_frecency()
+    free = list(LABELS)
+    text_labels = {}
+    taken_starts = []
+    taken_ends = []
+    for stage, pattern_ids in enumerate(PROGRESSIVE_STAGES):
+        with span("match", stage=stage, chars=len(plain_content)):
+            matches = []
+            for match in iter_matches(plain_content, pattern_ids):
+                start, end, _ = match
+                idx = bisect.bisect_left(taken_starts, end)
+                if idx and taken_ends[idx - 1] > start:
+                    continue
+                matches.append(match)
+        if not matches:
+            continue
+
+        priority = match_priority(matches, plain_content, cursor, frecency)
+        texts = [text for text in dict.fromkeys(text for _, _, text in matches) if text not in text_labels]
+        texts.sort(key=priority.__getitem__)
+        labels, free = allocate_labels(len(texts), free, reserve=int(stage + 1 < len(PROGRESSIVE_STAGES)))
+        text_labels.update(zip(texts, labels))
+        yield matches, [text_labels[text] for _, _, text in matches]
 
+        for start, end, _ in matches:
+            idx = bisect.bisect_left(taken_starts, start)
+            taken_starts.insert(idx, start)
+            taken_ends.insert(idx, end)
 
-def select_match(tty, colored_content, matches, labels):
-    """Interactive selection loop. Returns (selected_text, should_insert) or (None, False)."""
-    current_matches = matches[:]
-    current_labels = labels[:]
-    typed = ""
 
-    draw_screen(tty, colored_content, current_matches, current_labels)
+class LabelFeed:
+    """Runs iter_progressive_labels on a background thread, handing batches to the UI.
 
+    The UI waits on fd along with its TTY; every batch (and the end) makes it readable.
+    The thread owns the write end and closes it when done, so the UI can stop listening
+    (close) at any time without waiting for the matching to finish.
+    """
+
+    def __init__(self, plain_content, cursor=None):
+        self.batches = queue.SimpleQueue()
+        self.fd, self.wake_fd = os.pipe()
+        os.set_blocking(self.fd, False)
+        self.done = False
+        self.thread = threading.Thread(target=self._run, args=(plain_content, cursor), daemon=True)
+        self.thread.start()
+
+    def _run(self, plain_content, cursor):
+        try:
+            for batch in iter_progressive_labels(plain_content, cursor):
+                self.batches.put(batch)
+                self._wake()
+        finally:
+            self.batches.put(None)
+            self._wake()
+            os.close(self.wake_fd)
+
+    def _wake(self):
+        with contextlib.suppress(OSError):  # The UI may have stopped listening already
+            os.write(self.wake_fd, b"\0")
+
+    def take(self):
+        """Return the batches that arrived since the last call; sets done after the last one."""
+        with contextlib.suppress(BlockingIOError):
+            os.read(self.fd, 4096)
+        batches = []
+        while True:
+            try:
+                batch = self.batches.get_nowait()
+            except queue.Empty:
+                return batches
+            if batch is None:
+                self.done = True
+            else:
+                batches.append(batch)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LabelNode:
+    """A node of the label trie: the entries whose labels start with the path to it."""
+
+    __slots__ = ("parent", "depth", "children", "entries")
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.children: dict[str, LabelNode] = {}
+        self.entries: list[tuple] = []  # (pane index, match, label), in screen order
+
+
+def build_label_trie(entries, root=None):
+    """Index (pane index, match, label) entries by label; labels are prefix-free, so they end on leaves.
+
+    Entries are added to root when given, otherwise to a new trie. Returns the root.
+    """
+    root = root or LabelNode()
+    for entry in entries:
+        node = root
+        node.entries.append(entry)
+        for char in entry[2]:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = LabelNode(node)
+            node = child
+            node.entries.append(entry)
+    return root
+
+
+def select_match(tty, colored_content, matches, labels, paging=False, other_panes=(), feed=None, marked=None):
+    """Interactive selection loop. Returns (selected_texts, should_insert), or ([], False) if cancelled.
+
+    With paging, the scrollback keys raise PageRequest instead of exiting. other_panes are
+    extra (tty, colored_content, matches, labels) overlays that share the label namespace;
+    keys are only read from tty. Each key steps one node through the label trie, and
+    Backspace steps back up.
+
+    A label typed with Alt held (on any of its keys) toggles a mark on its text and keeps
+    the overlay open. Enter, or a label typed without Alt, then picks every marked text,
+    in the order marked, copied to the clipboard in one go. marked is the dict of marked
+    texts, so it can carry marks across calls (e.g. scrollback pages); it is updated in place.
+
+    With a LabelFeed, tty's pane starts out as the bare capture and labels are added as
+    the feed delivers them. Keys that do not fit the labels so far are held until the
+    feed is done, so type-ahead for labels still being matched resolves correctly.
+    """
+    panes = [(tty, colored_content, matches, labels), *other_panes]
+    frames = [(pane_tty, Frame(content, pane_matches)) for pane_tty, content, pane_matches, _ in panes]
+    root = build_label_trie(
+        (idx, m, l)
+        for idx, (_, _, pane_matches, pane_labels) in enumerate(panes)
+        for m, l in zip(pane_matches, pane_labels)
+    )
+    marked = {} if marked is None else marked
+
+    def draw(node):
+        """Draw every pane with its share of node's entries, labels shown past the typed prefix.
+
+        Marked matches outside node stay on screen with their whole label.
+        """
+        shown = [([], []) for _ in frames]
+        entries = [(entry, entry[2][node.depth:] or entry[2]) for entry in node.entries]
+        if marked and node is not root:
+            under_node = set(map(id, node.entries))
+            entries += [
+                (entry, entry[2]) for entry in root.entries
+                if entry[1][2] in marked and id(entry) not in under_node
+            ]
+        if feed is not None or len(entries) > len(node.entries):
+            # Fed and marked entries are out of screen order, while painting goes in it
+            entries.sort(key=lambda item: item[0][1][0])
+        for (idx, m, _), label in entries:
+            shown[idx][0].append(m)
+            shown[idx][1].append(label)
+        for (pane_tty, frame), (pane_matches, pane_labels) in zip(frames, shown):
+            draw_screen(pane_tty, frame, pane_matches, pane_labels, marked)
+
+    def finish(text, should_insert):
+        """Pick text along with everything marked, copying them all with one write."""
+        if text is not None:
+            marked.setdefault(text, True)
+        texts = list(marked)
+        tty.copy_to_clipboard(MULTI_SEPARATOR.join(texts))
+        return texts, should_insert
+
+    node = root
+    with span("first paint", matches=len(root.entries)):
+        draw(node)
+
+    held = []  # Keys waiting for the feed
+    marking = False  # Alt was held for a key of the label being typed
+    insert_marked = False  # Shift was held when marking
     while True:
-        char = tty.read_key()
-        log.debug(f"Key pressed: {char!r}, typed: {typed!r}")
-
-        # ESC or Ctrl+C - cancel
-        if char in ("\x1b", "\x03"):
-            log.info("Selection cancelled")
-            return None, False
-
-        # Enter - select exact match if one exists
-        if char in ("\r", "\n"):
-            if typed in current_labels:
-                idx = current_labels.index(typed)
-                selected_text = current_matches[idx][2]
-                tty.copy_to_clipboard(selected_text)
-                return selected_text, False  # Enter doesn't indicate shift
-            continue
+        keys = tty.read_keys(feed.fd if feed and not feed.done else None)
+        with span("keys", keys=repr(keys)):
+            # Type-ahead is applied key by key, with one redraw for the whole batch
+            shown = node
+            if feed and not feed.done:
+                for batch_matches, batch_labels in feed.take():
+                    frames[0][1].add_matches(batch_matches)
+                    build_label_trie(((0, m, l) for m, l in zip(batch_matches, batch_labels)), root)
+                    shown = None
+                    log.debug(f"Fed {len(batch_matches)} matches")
+                if feed.done and not root.entries:
+                    log.info("No matches found, exiting")
+                    return [], False
+            keys, held = held + keys, []
+            for key_idx, char in enumerate(keys):
+                log.debug(f"Key pressed: {char!r}, depth: {node.depth}")
+
+                # ESC or Ctrl+C - cancel
+                if char in ("\x1b", "\x03"):
+                    log.info("Selection cancelled")
+                    return [], False
+
+                if paging and char in (PAGE_OLDER, PAGE_NEWER):
+                    raise PageRequest(1 if char == PAGE_OLDER else -1)
+
+                # Enter - select exact match if one exists, or confirm the marked ones
+                if char in ("\r", "\n"):
+                    if node is not root and not node.children:
+                        return finish(node.entries[0][1][2], insert_marked)  # Enter doesn't indicate shift
+                    if marked:
+                        return finish(None, insert_marked)
+                    continue
+
+                # Backspace - forget the last typed character
+                if char in ("\x7f", "\x08"):
+                    node = node.parent or node
+                    continue
+
+                # Alt+label - mark instead of select
+                if len(char) == 2 and char[0] == "\x1b" and char[1].lower() in LABELS:
+                    char = char[1]
+                    marking = True
+
+                # Exit on non-label keys
+                char_lower = char.lower()
+                if char_lower not in LABELS:
+                    log.info(f"Invalid key: {char!r}, exiting")
+                    return [], False
+
+                # Shift held = insert after selection
+                should_insert = char.isupper()
+                child = node.children.get(char_lower)
+
+                if child is None and feed and not feed.done:
+                    # Could be a label that is still being matched
+                    held = keys[key_idx:]
+                    break
+                if child is None:
+                    # No matches, reset
+                    log.debug("No matches, resetting")
+                    node = root
+                    marking = False
+                elif not child.children and marking:
+                    # Complete label with Alt - toggle its mark and start over
+                    selected_text = child.entries[0][1][2]
+                    if marked.pop(selected_text, None) is None:
+                        marked[selected_text] = True
+                        insert_marked = insert_marked or should_insert
+                    log.debug(f"Marked: {list(marked)}")
+                    node = root
+                    marking = False
+                    shown = None
+                elif not child.children:
+                    # Unambiguous match - select it
+                    return finish(child.entries[0][1][2], should_insert or insert_marked)
+                else:
+                    # Incomplete label - narrow and continue
+                    node = child
+                    log.debug(f"Narrowed to {len(node.entries)} matches, should_insert: {should_insert}")
 
-        # Exit on non-label characters
-        char_lower = char.lower()
-        if char_lower not in LABELS:
-            log.info(f"Invalid key: {char!r}, exiting")
-            return None, False
-
-        # Shift held = insert after selection
-        should_insert = char.isupper()
-        typed += char_lower
-        log.debug(f"Typed: {typed!r}, should_insert: {should_insert}")
-
-        # Filter matches by prefix, deduplicate by label
-        seen_labels = set()
-        filtered = []
-        for m, l in zip(current_matches, current_labels):
-            if l.startswith(typed) and l not in seen_labels:
-                filtered.append((m, l))
-                seen_labels.add(l)
-
-        if not filtered:
-            # No matches, reset
-            log.debug("No matches, resetting")
-            typed = ""
-            current_matches = matches[:]
-            current_labels = labels[:]
-            draw_screen(tty, colored_content, current_matches, current_labels)
-        elif len(filtered) == 1 and filtered[0][1] == typed:
-            # Unambiguous match - select it
-            selected_text = filtered[0][0][2]
-            tty.copy_to_clipboard(selected_text)
-            return selected_text, should_insert
-        else:
-            # Multiple matches or incomplete label - filter and continue
-            current_matches, current_labels = map(list, zip(*filtered))
-            display_labels = [l[len(typed):] or l for l in current_labels]
-            draw_screen(tty, colored_content, current_matches, display_labels)
-            log.debug(f"Filtered to {len(current_matches)} matches")
+            if node is not shown:
+                draw(node)
 
 
-def main_parent():
-    """Parent mode: capture content and spawn child in swapped pane."""
-    log.info("Starting colors.py (parent mode)")
+def send_handoff(fifo_path, payload):
+    """Write payload into the handoff FIFO once the child has opened it for reading."""
+    deadline = time.monotonic() + HANDOFF_TIMEOUT
+    while True:
+        try:
+            fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            if e.errno != errno.ENXIO or time.monotonic() > deadline:
+                raise
+            time.sleep(0.002)  # No reader yet
 
     try:
-        pane_id = tmux("display-message", "-p", "#{pane_id}")
+        os.set_blocking(fd, True)
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def receive_handoff(fifo_path):
+    """Read the parent's (colored_content, matches, labels, scrollback, others, cursor) from the handoff FIFO."""
+    with open(fifo_path, "rb") as f:
+        return marshal.loads(f.read())
+
+
+def iter_scrollback(pane_id, height, history_size, page, step):
+    """Yield (page, colored_content) for each viewport from page on, moving step pages at a time.
+
+    Page 0 is the visible screen and page n ends n screens further back. Only one
+    viewport is captured (and held) at a time, so memory does not grow with history.
+    """
+    oldest = -(-history_size // height)
+    while 0 <= page <= oldest:
+        first_row = -page * height
+        with span("capture", pane=pane_id, page=page):
+            colored_content = tmux(
+                "capture-pane", "-p", "-e", "-t", pane_id,
+                "-S", str(max(first_row, -history_size)), "-E", str(first_row + height - 1),
+                strip=False,
+            )
+        yield page, colored_content
+        page += step
+
+
+def iter_labelled_viewports(viewports, cursor=None):
+    """Match and label viewports as they are pulled, skipping those without matches.
+
+    Viewports are cut on row boundaries and no pattern spans a newline, so matching
+    each one alone gives the same matches as scanning the whole history at once.
+    """
+    frecency = load_frecency()
+    for page, colored_content in viewports:
+        plain_content = strip_ansi(colored_content)
+        matches = find_patterns_cached(plain_content)
+        if not matches:
+            continue
+        priority = match_priority(matches, plain_content, cursor if page == 0 else None, frecency)
+        yield page, colored_content, matches, generate_labels_for_matches(matches, priority)
+
+
+def capture_window(pane_id, cursor):
+    """Capture every visible pane in pane_id's window in one batch and label them from one namespace.
+
+    Returns [(pane_id, colored_content, matches, labels)] with pane_id's own pane first.
+    Labels go to pane_id's matches nearest the cursor first, then to the other panes.
+    """
+    panes = []
+    for line in tmux("list-panes", "-t", pane_id, "-F", "#{pane_id} #{window_zoomed_flag}").splitlines():
+        target, zoomed = line.split()
+        if target == pane_id or zoomed == "0":
+            panes.append(target)
+    panes.sort(key=lambda target: target != pane_id)
+
+    # One round trip for all the captures; matching is GIL-bound, so it runs afterwards in turn
+    with span("capture", panes=len(panes)):
+        captures = tmux_batch(*(["capture-pane", "-p", "-e", "-t", target] for target in panes))
+    scans = []
+    for colored_content in captures:
+        plain_content = strip_ansi(colored_content)
+        scans.append((colored_content, plain_content, find_patterns_cached(plain_content)))
+
+    frecency = load_frecency()
+    priority = {}
+    for rank, (_, plain_content, matches) in enumerate(scans):
+        keys = match_priority(matches, plain_content, cursor if rank == 0 else None, frecency)
+        for text, (frecency_key, *distance) in keys.items():
+            key = (frecency_key, rank > 0, *distance)
+            priority[text] = min(priority.get(text, key), key)
+
+    all_labels = iter(generate_labels_for_matches([m for _, _, matches in scans for m in matches], priority))
+    log.debug(f"pane_id={pane_id}, window panes={panes}")
+    return [
+        (target, colored_content, matches, [next(all_labels) for _ in matches])
+        for target, (colored_content, _, matches) in zip(panes, scans)
+    ]
+
+
+def capture_and_label(pane_id, cursor, scrollback=False, window=False, progressive=False):
+    """Capture pane_id and return (colored_content, matches, labels, scrollback, others); empty lists if nothing matches.
+
+    In scrollback mode this is the newest viewport with matches and scrollback is
+    (page, history_size, height), so the UI can page further; otherwise it is None.
+    In window mode others holds (pane_id, colored_content, matches, labels) for the
+    window's other panes that have matches. In progressive mode nothing is matched
+    yet: matches and labels are None and run_selection matches as it paints.
+    """
+    if scrollback:
+        history_size, height = map(int, tmux(
+            "display-message", "-p", "-t", pane_id, "#{history_size} #{pane_height}"
+        ).split())
+        viewports = iter_labelled_viewports(iter_scrollback(pane_id, height, history_size, 0, 1), cursor)
+        page, colored_content, matches, labels = next(viewports, (0, "", [], []))
+        log.debug(f"pane_id={pane_id}, history_size={history_size}, page={page}")
+        return colored_content, matches, labels, (page, history_size, height), []
+
+    if window:
+        (_, colored_content, matches, labels), *others = capture_window(pane_id, cursor)
+        return colored_content, matches, labels, None, [other for other in others if other[2]]
+
+    with span("capture", pane=pane_id):
         colored_content = tmux("capture-pane", "-p", "-e", "-t", pane_id)
-        log.debug(f"pane_id={pane_id}, content_len={len(colored_content)}")
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        log.error(f"tmux error: {e}")
-        print(f"tmux error: {e}", file=sys.stderr)
-        return 1
+    log.debug(f"pane_id={pane_id}, cursor={cursor}, content_len={len(colored_content)}")
+    if progressive:
+        return colored_content, None, None, None, []
 
-    # Early exit if no matches (match on plain text)
+    # Match on plain text, display with colors
     plain_content = strip_ansi(colored_content)
-    matches = find_patterns(plain_content)
+    matches = find_patterns_cached(plain_content)
     if not matches:
-        log.info("No matches found, exiting")
-        return 0
+        return colored_content, [], [], None, []
 
-    log.info(f"Found {len(matches)} matches")
+    priority = match_priority(matches, plain_content, cursor, load_frecency())
+    return colored_content, matches, generate_labels_for_matches(matches, priority), None, []
 
-    # Write colored content to temp file (avoids escaping issues on command line)
-    content_file = f"/tmp/colors_content_{os.getpid()}"
-    with open(content_file, 'w') as f:
-        f.write(colored_content)
-    log.debug(f"Wrote content to {content_file}")
 
-    # Ensure _tmp session exists
-    try:
-        tmux("has-session", "-t", "_tmp")
-    except subprocess.CalledProcessError:
-        tmux("new-session", "-d", "-s", "_tmp")
-        log.debug("Created _tmp session")
-
-    # Create window in _tmp session with child process, get new pane ID
-    script_path = os.path.abspath(__file__)
-    new_pane_id = tmux(
-        "new-window", "-t", "_tmp", "-d", "-P", "-F", "#{pane_id}",
-        f"python3 {script_path} --child {pane_id} {content_file}"
+def spawn_child(pane_id, command, keep_focus=False):
+    """Run command in a hidden _tmp window and swap it in place of pane_id. Returns (new_pane_id, new_tty).
+
+    With keep_focus the window's active pane stays where it is instead of following the swap.
+    """
+    # Ensure _tmp session exists (the control connection is attached to it already)
+    if control is None:
+        try:
+            tmux("has-session", "-t", "_tmp")
+        except subprocess.CalledProcessError:
+            tmux("new-session", "-d", "-s", "_tmp")
+            log.debug("Created _tmp session")
+
+    # Create window in _tmp session with child process, then swap it in (instantaneous,
+    # no visual flash). The unique window name lets all three go out in one batch. The
+    # window takes pane_id's size first, so the swapped-out pane is not reflowed while
+    # it waits there (scrollback pages are captured from it by row).
+    width, height = tmux("display-message", "-p", "-t", pane_id, "#{pane_width} #{pane_height}").split()
+    window = f"colors-{os.getpid()}-{next(window_ids)}"
+    new_window, *_ = tmux_batch(
+        ["new-window", "-t", "_tmp:", "-d", "-n", window, "-P", "-F", "#{pane_id} #{pane_tty}", command],
+        ["resize-window", "-t", f"=_tmp:{window}", "-x", width, "-y", height],
+        ["swap-pane", *(["-d"] if keep_focus else []), "-s", f"=_tmp:{window}.0", "-t", pane_id],
     )
-    log.debug(f"Created new window in _tmp with pane {new_pane_id}")
+    new_pane_id, new_tty = new_window.split()
+    log.debug(f"Swapped new _tmp pane {new_pane_id} <-> {pane_id}")
+    return new_pane_id, new_tty
 
-    # Swap panes (instantaneous, no visual flash)
-    tmux("swap-pane", "-s", new_pane_id, "-t", pane_id)
-    log.debug(f"Swapped panes {new_pane_id} <-> {pane_id}")
 
-    log.info("Parent done")
-    return 0
+def swap_back_command(own_pane_id, original_pane_id):
+    """Return a command that swaps own_pane_id back out, unless that already happened.
 
+    The swap is skipped once own_pane_id is in the _tmp session again, so the parent
+    and the child can both run it after a failed handoff without swapping twice.
+    """
+    return [
+        "if-shell", "-F", "-t", own_pane_id, "#{!=:#{session_name},_tmp}",
+        shlex.join(["swap-pane", "-s", own_pane_id, "-t", original_pane_id]),
+    ]
 
-def main_child(original_pane_id, content_file):
-    """Child mode: display selection UI in swapped pane."""
-    log.info(f"Starting colors.py (child mode), original_pane={original_pane_id}")
 
-    own_pane_id = tmux("display-message", "-p", "#{pane_id}")
-    own_tty = tmux("display-message", "-p", "#{pane_tty}")
-    log.debug(f"own_pane_id={own_pane_id}, own_tty={own_tty}")
+def place_overlays(others):
+    """Swap a placeholder in for each of the other panes so their overlays can be drawn in place.
 
-    # Read colored content from temp file
+    Takes capture_and_label's others and returns them as
+    (original_pane_id, placeholder_pane_id, placeholder_tty, colored_content, matches, labels).
+    """
+    placed = []
     try:
-        with open(content_file) as f:
-            colored_content = f.read()
-        os.unlink(content_file)  # Clean up
-        log.debug(f"Read and removed {content_file}")
-    except FileNotFoundError:
-        log.error(f"Content file not found: {content_file}")
-        return 1
+        for original_pane_id, *capture in others:
+            placeholder = spawn_child(original_pane_id, PLACEHOLDER_COMMAND, keep_focus=True)
+            placed.append((original_pane_id, *placeholder, *capture))
+    except subprocess.CalledProcessError:
+        remove_overlays(placed)
+        raise
+    return placed
 
-    # Match on plain text, display with colors
-    plain_content = strip_ansi(colored_content)
-    matches = find_patterns(plain_content)
-    labels = generate_labels_for_matches(matches)
 
-    log.info(f"Found {len(matches)} matches")
-    for (start, end, text), label in zip(matches, labels):
+def overlay_restore_commands(placed):
+    """Return the tmux commands that swap place_overlays' panes back and kill the placeholders."""
+    commands = []
+    for original_pane_id, placeholder_pane_id, *_ in placed:
+        commands.append(["swap-pane", "-d", "-s", placeholder_pane_id, "-t", original_pane_id])
+        commands.append(["kill-pane", "-t", placeholder_pane_id])
+    return commands
+
+
+def remove_overlays(placed):
+    """Undo place_overlays when the selection UI never got to run."""
+    if placed:
+        with contextlib.suppress(subprocess.CalledProcessError):
+            tmux_batch(*overlay_restore_commands(placed))
+
+
+def run_selection(
+    original_pane_id, own_pane_id, own_tty, colored_content, matches, labels, scrollback=None, others=(), cursor=None,
+):
+    """Run the selection UI on own_tty, swap back and act on the selection.
+
+    scrollback is (page, history_size, height) from capture_and_label, or None. others
+    are the window's other panes from place_overlays; their placeholders are killed here.
+    With matches None (progressive mode) the capture is matched here, for cursor.
+    """
+    for (start, end, text), label in zip(matches or (), labels or ()):
         log.debug(f"  [{label}] pos {start}-{end}: {text!r}")
 
-    selected = None
+    selected = []
     should_insert = False
+    marked = {}  # Kept across scrollback pages
+
+    try:
+        with TTY(own_tty) as tty, contextlib.ExitStack() as stack:
+            tty.enter_raw_mode()
+            tty.hide_cursor()
+            tty.clear_and_home()
+
+            feed = None
+            if matches is None:
+                feed = LabelFeed(strip_ansi(colored_content), cursor)
+                stack.callback(feed.close)
+                matches, labels = [], []
+
+            other_panes = []
+            for _, _, placeholder_tty, other_content, other_matches, other_labels in others:
+                other_tty = stack.enter_context(TTY(placeholder_tty))
+                other_tty.hide_cursor()
+                other_tty.clear_and_home()
+                other_panes.append((other_tty, other_content, other_matches, other_labels))
+
+            try:
+                while True:
+                    try:
+                        selected, should_insert = select_match(
+                            tty, colored_content, matches, labels,
+                            paging=scrollback is not None, other_panes=other_panes, feed=feed, marked=marked,
+                        )
+                        break
+                    except PageRequest as request:
+                        # Stay on the current viewport when there is nothing further that way
+                        page, history_size, height = scrollback
+                        viewports = iter_scrollback(
+                            original_pane_id, height, history_size, page + request.step, request.step,
+                        )
+                        viewport = next(iter_labelled_viewports(viewports), None)
+                        if viewport:
+                            page, colored_content, matches, labels = viewport
+                            scrollback = (page, history_size, height)
+                            log.debug(f"Paged to viewport {page} with {len(matches)} matches")
+                log.info(f"Selected: {selected!r}, should_insert: {should_insert}")
+            except Exception as e:
+                log.error(f"Error: {e}")
+
+            tty.show_cursor()
+    finally:
+        # Swap back (returns user to original pane), inserting the text if Shift was held. This runs
+        # even if the UI failed to start, so the user's pane is never left behind in _tmp.
+        commands = [["swap-pane", "-s", own_pane_id, "-t", original_pane_id], *overlay_restore_commands(others)]
+        if selected and should_insert:
+            text = MULTI_SEPARATOR.join(selected)
+            log.info(f"Inserting into pane {original_pane_id}: {text!r}")
+            commands.append(["send-keys", "-t", original_pane_id, "-l", text])
+        try:
+            tmux_batch(*commands)
+            log.debug(f"Swapped back: {own_pane_id} <-> {original_pane_id}")
+        except subprocess.CalledProcessError as e:
+            log.error(f"tmux error: {e}")
+
+    if selected:
+        record_selection(selected)
+
+
+def runtime_dir():
+    """Return $XDG_RUNTIME_DIR, or a directory under /tmp that only we can access."""
+    path = os.environ.get("XDG_RUNTIME_DIR")
+    if not path:
+        path = f"/tmp/colors-{os.getuid()}"
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+def socket_path():
+    """Return the daemon's Unix socket path, in a directory only we can access."""
+    return os.path.join(runtime_dir(), "colors.sock")
+
+
+def trigger_daemon(pane_id, cursor, scrollback=False, window=False, progressive=False):
+    """Ask a running daemon to handle pane_id. Returns its reply, or None if no daemon took the request.
+
+    Once the request is sent the daemon owns it: a slow reply is not a reason to run one-shot
+    as well, which would put a second overlay over the same pane.
+    """
+    request = {
+        "pane_id": pane_id, "cursor": cursor,
+        "scrollback": scrollback, "window": window, "progressive": progressive,
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(DAEMON_TIMEOUT)
+        try:
+            sock.connect(socket_path())
+            sock.sendall(json.dumps(request).encode() + b"\n")
+        except OSError as e:
+            log.debug(f"No daemon: {e}")
+            return None
+        try:
+            reply = sock.makefile("rb").readline()
+        except OSError as e:
+            log.warning(f"Daemon has not replied, leaving the request to it: {e}")
+            return {"ok": True, "matches": None}
+    return json.loads(reply) if reply else {"ok": False, "error": "daemon closed the connection without replying"}
+
+
+def handle_request(conn):
+    """Daemon side of one trigger: capture, label, then run the UI on a placeholder pane."""
+    try:
+        with span("request"):
+            serve_request(conn)
+    finally:
+        if tracer is not None:
+            tracer.flush()
+
+
+def serve_request(conn):
+    """Handle one request for handle_request."""
+    with conn:
+        try:
+            request = json.loads(conn.makefile("rb").readline())
+            pane_id, cursor = request["pane_id"], tuple(request["cursor"])
+            connect_control()  # Reconnects if tmux dropped the previous connection
+            progressive = request.get("progressive", False)
+            colored_content, matches, labels, scrollback, others = capture_and_label(
+                pane_id, cursor, request.get("scrollback", False), request.get("window", False), progressive
+            )
+            if not progressive and not matches and not others:
+                conn.sendall(b'{"ok": true, "matches": 0}\n')
+                save_match_cache()
+                return
+            # The panes only have to exist; the daemon itself drives their TTYs
+            others = place_overlays(others)
+            try:
+                own_pane_id, own_tty = spawn_child(pane_id, PLACEHOLDER_COMMAND)
+            except subprocess.CalledProcessError:
+                remove_overlays(others)
+                raise
+        except (ValueError, KeyError, TypeError, subprocess.CalledProcessError, OSError) as e:
+            log.error(f"Daemon request failed: {e}")
+            conn.sendall(json.dumps({"ok": False, "error": str(e)}).encode() + b"\n")
+            return
+        count = None if progressive else len(matches) + sum(len(other[4]) for other in others)
+        conn.sendall(json.dumps({"ok": True, "matches": count}).encode() + b"\n")
+    save_match_cache()
+
+    try:
+        run_selection(pane_id, own_pane_id, own_tty, colored_content, matches, labels, scrollback, others, cursor)
+    finally:
+        with contextlib.suppress(subprocess.CalledProcessError):
+            tmux("kill-pane", "-t", own_pane_id)
+
+
+def daemon_alive(path):
+    """Return True if something accepts connections on path."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
 
-    with TTY(own_tty) as tty:
-        tty.enter_raw_mode()
-        tty.hide_cursor()
-        tty.clear_and_home()
 
+def main_daemon():
+    """Daemon mode: keep the interpreter warm and serve triggers over a Unix socket."""
+    path = socket_path()
+    if daemon_alive(path):
+        print(f"Daemon already listening on {path}", file=sys.stderr)
+        return 1
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)  # Stale socket from a daemon that died
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(path)
+        os.chmod(path, 0o600)
+        server.listen()
+        log.info(f"Daemon listening on {path}")
+        connect_control()
         try:
-            selected, should_insert = select_match(tty, colored_content, matches, labels)
-            log.info(f"Selected: {selected!r}, should_insert: {should_insert}")
-        except Exception as e:
-            log.error(f"Error: {e}")
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=handle_request, args=(conn,), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+    return 0
+
+
+def main_parent(pane_id=None, cursor=None, scrollback=False, window=False, progressive=False):
+    """Parent mode: capture content and spawn child in swapped pane."""
+    log.info("Starting colors.py (parent mode)")
+
+    try:
+        # Without --pane, ask which pane the invoking client is on
+        if pane_id is None:
+            pane_id, cursor_x, cursor_y = tmux("display-message", "-p", "#{pane_id} #{cursor_x} #{cursor_y}").split()
+            cursor = (int(cursor_x), int(cursor_y))
+
+        # A running daemon does everything with warm state
+        reply = trigger_daemon(pane_id, cursor, scrollback, window, progressive)
+        if reply is not None:
+            log.info(f"Handled by daemon: {reply}")
+            if not reply.get("ok"):
+                print(f"colors daemon error: {reply.get('error')}", file=sys.stderr)
+                return 1
+            return 0
+
+        connect_control()
+        colored_content, matches, labels, scrollback, others = capture_and_label(
+            pane_id, cursor, scrollback, window, progressive
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        log.error(f"tmux error: {e}")
+        print(f"tmux error: {e}", file=sys.stderr)
+        return 1
+
+    # Early exit if no matches (progressive mode only finds out in the child)
+    if progressive:
+        log.info("Progressive mode, matching in the child")
+    elif not matches and not others:
+        log.info("No matches found, exiting")
+        save_match_cache()
+        return 0
+    else:
+        log.info(f"Found {len(matches) + sum(len(other[2]) for other in others)} matches")
+
+    handoff_dir = None
+    placed = []
+    child_pane_id = None
+    try:
+        # Hand everything to the child through a FIFO so it never touches disk or re-matches.
+        # It sits in a fresh private directory, so no leftover or planted file can be in the way.
+        handoff_dir = tempfile.mkdtemp(prefix="handoff-", dir=runtime_dir())
+        fifo_path = os.path.join(handoff_dir, "fifo")
+        os.mkfifo(fifo_path, 0o600)
+        placed = place_overlays(others)
+        handoff = marshal.dumps((colored_content, matches, labels, scrollback, placed, cursor))
+        # Same interpreter, so the marshal handoff format matches
+        script_path = os.path.abspath(__file__)
+        child_command = [sys.executable, script_path, "--child", pane_id, fifo_path]
+        if tracer is not None:
+            child_command += ["--trace", tracer.path]
+        child_pane_id, _ = spawn_child(pane_id, shlex.join(child_command))
+        with span("handoff", size=len(handoff)):
+            send_handoff(fifo_path, handoff)
+        log.debug(f"Handed off {len(handoff)} bytes through {fifo_path}")
+    except (subprocess.CalledProcessError, OSError) as e:
+        log.error(f"Handoff failed: {e}")
+        # Put the user's pane back and drop the child, which would otherwise wait on the FIFO
+        if child_pane_id is not None:
+            with contextlib.suppress(subprocess.CalledProcessError):
+                tmux_batch(swap_back_command(child_pane_id, pane_id), ["kill-pane", "-t", child_pane_id])
+        remove_overlays(placed)
+        return 1
+    finally:
+        if handoff_dir is not None:
+            shutil.rmtree(handoff_dir, ignore_errors=True)
+        if control is not None:
+            control.close()
+
+    # The child is up by now, so this is off the critical path
+    save_match_cache()
+    log.info("Parent done")
+    return 0
+
+
+def main_child(original_pane_id, fifo_path):
+    """Child mode: display selection UI in swapped pane."""
+    log.info(f"Starting colors.py (child mode), original_pane={original_pane_id}")
 
-        tty.show_cursor()
+    # Attaches in the background while the user picks; only needed to swap back
+    connect_control()
 
-    # Swap back before exiting (returns user to original pane)
-    tmux("swap-pane", "-s", own_pane_id, "-t", original_pane_id)
-    log.debug(f"Swapped back: {own_pane_id} <-> {original_pane_id}")
+    # tmux tells every pane process its pane ID, and stdin is the pane's TTY
+    own_pane_id = os.environ.get("TMUX_PANE")
+    if own_pane_id and os.isatty(sys.stdin.fileno()):
+        own_tty = os.ttyname(sys.stdin.fileno())
+    else:
+        own_pane_id, own_tty = tmux("display-message", "-p", "#{pane_id} #{pane_tty}").split()
+    log.debug(f"own_pane_id={own_pane_id}, own_tty={own_tty}")
+
+    # Matches and labels were computed by the parent
+    try:
+        with span("handoff"):
+            colored_content, matches, labels, scrollback, others, cursor = receive_handoff(fifo_path)
+        log.debug(f"Read handoff from {fifo_path}")
+    except (OSError, ValueError, EOFError) as e:
+        log.error(f"Handoff not readable: {fifo_path}: {e}")
+        # The parent gave up on us (or died), so return the user's pane ourselves
+        with contextlib.suppress(subprocess.CalledProcessError):
+            tmux_batch(swap_back_command(own_pane_id, original_pane_id))
+        return 1
 
-    # Insert text if Shift was held
-    if selected and should_insert:
-        log.info(f"Inserting into pane {original_pane_id}: {selected!r}")
-        subprocess.run(["tmux", "send-keys", "-t", original_pane_id, "-l", selected], check=False)
+    if matches is None:
+        log.info("Received capture to match progressively")
+    else:
+        log.info(f"Received {len(matches)} matches and {len(others)} other panes")
+    run_selection(original_pane_id, own_pane_id, own_tty, colored_content, matches, labels, scrollback, others, cursor)
+    if control is not None:
+        control.close()
+    save_match_cache()  # Only used when paging through scrollback
 
     log.info("Child done")
     return 0
@@ -426,16 +1786,37 @@ def main_child(original_pane_id, content_file):
 def main():
     parser = argparse.ArgumentParser(description="Tmux pattern matcher")
     parser.add_argument("--child", metavar="PANE_ID", help="Run in child mode with original pane ID")
-    parser.add_argument("content_file", nargs="?", help="Path to content file (child mode only)")
+    parser.add_argument("--pane", metavar="PANE_ID", help="Pane to capture, e.g. '#{pane_id}' from the binding")
+    parser.add_argument("--cursor", metavar="X,Y", default="0,0", help="Cursor position in --pane")
+    parser.add_argument("--scrollback", action="store_true", help="Search the history too, paging with Ctrl+U/Ctrl+D")
+    parser.add_argument("--window", action="store_true", help="Label every visible pane in the window at once")
+    parser.add_argument(
+        "--progressive", action="store_true",
+        help="Show the capture at once and add labels as matching finishes, URLs and paths first",
+    )
+    parser.add_argument("--daemon", action="store_true", help="Stay running and serve triggers over a Unix socket")
+    parser.add_argument(
+        "--trace", metavar="FILE", default=os.environ.get(TRACE_ENV),
+        help=f"Append Chrome-trace timing spans to FILE and log at DEBUG level (default: ${TRACE_ENV})",
+    )
+    parser.add_argument("handoff", nargs="?", help="Path to the handoff FIFO (child mode only)")
     args = parser.parse_args()
+    if args.scrollback + args.window + args.progressive > 1:
+        parser.error("--scrollback, --window and --progressive are mutually exclusive")
+
+    if args.trace:
+        enable_tracing(args.trace, "colors daemon" if args.daemon else "colors child" if args.child else "colors")
 
+    if args.daemon:
+        return main_daemon()
     if args.child:
-        if not args.content_file:
-            print("Error: content_file required in child mode", file=sys.stderr)
+        if not args.handoff:
+            print("Error: handoff required in child mode", file=sys.stderr)
             return 1
-        return main_child(args.child, args.content_file)
+        return main_child(args.child, args.handoff)
     else:
-        return main_parent()
+        cursor = tuple(map(int, args.cursor.split(",")))
+        return main_parent(args.pane, cursor if args.pane else None, args.scrollback, args.window, args.progressive)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for colors.py's hot paths on generated pane captures.
+
+Times find_patterns, match_priority + generate_labels_for_matches, draw_screen (full paint
+and diff repaint) and select_match key latency. Key latency runs end to end through a pty:
+keys go into the master side, the real TTY class reads them on the slave side, and the time
+is taken when select_match is back waiting for the next keys (the redraw is complete by
+then). The bytes each key's redraw writes to the pty are reported alongside (bytes_per_key).
+
+Usage: colors_bench.py [--filter SUBSTR] [--save] [--baseline FILE] [--threshold 0.2]
+
+Results are compared against the baseline (default $XDG_STATE_HOME/colors/bench-baseline.json)
+and the exit status is 1 if any median regressed by more than the threshold. --save
+writes the current results as the new baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import pty
+import random
+import statistics
+import sys
+import threading
+import time
+
+import colors
+
+BASELINE_FILE = os.path.join(colors.STATE_DIR, "bench-baseline.json")
+SEED = 1234
+SCREEN_ROWS = 50
+SCREEN_COLS = 200
+SCROLLBACK_LINES = 10_000
+
+SGR_COLORS = ["31", "32", "33", "34", "35", "36", "1;31", "1;33", "1;36", "38;5;208", "38;5;244"]
+
+
+# Corpora
+
+def sgr(rng, text):
+    """Wrap text in a random colour."""
+    return f"\033[{rng.choice(SGR_COLORS)}m{text}\033[0m"
+
+
+def hex_hash(rng, length=40):
+    return "".join(rng.choice("0123456789abcdef") for _ in range(length))
+
+
+def ipv4(rng):
+    return ".".join(str(rng.randrange(256)) for _ in range(4))
+
+
+def ipv6(rng):
+    return ":".join(f"{rng.randrange(0x10000):x}" for _ in range(8))
+
+
+def source_path(rng):
+    parts = [rng.choice(["src", "lib", "crates", "vendor", "pkg"])]
+    parts += [rng.choice(["core", "net", "io", "util", "parser", "render"]) for _ in range(rng.randrange(1, 4))]
+    return "./" + "/".join(parts) + rng.choice([".rs", ".c", ".py", ".ts"])
+
+
+def compiler_line(rng):
+    """A line of ANSI-heavy compiler output."""
+    kind = rng.random()
+    if kind < 0.3:
+        level = sgr(rng, rng.choice(["error", "warning"]))
+        return f"{level}\033[1m: unused variable `{rng.choice(['x', 'buf', 'ctx'])}`\033[0m [E0{rng.randrange(100, 999)}]"
+    if kind < 0.6:
+        return f"  \033[1;34m-->\033[0m {source_path(rng)}:{rng.randrange(1, 3000)}:{rng.randrange(1, 120)}"
+    if kind < 0.8:
+        code = " ".join(sgr(rng, rng.choice(["let", "fn", "match", "return", "self"])) for _ in range(rng.randrange(3, 9)))
+        return f"\033[1;34m{rng.randrange(1, 3000):>5} |\033[0m     {code}"
+    return f"\033[1;34m      |\033[0m {sgr(rng, '^' * rng.randrange(1, 30))}"
+
+
+def log_line(rng):
+    """A server log line full of addresses."""
+    address = ipv6(rng) if rng.random() < 0.2 else f"{ipv4(rng)}:{rng.randrange(1024, 65536)}"
+    return (
+        f"2024-0{rng.randrange(1, 10)}-1{rng.randrange(10)} 12:{rng.randrange(60):02}:{rng.randrange(60):02} "
+        f"{sgr(rng, rng.choice(['INFO', 'WARN', 'DEBUG']))} conn from {address} -> {ipv4(rng)} "
+        f"GET /api/v1/items/{rng.randrange(100000)} {rng.choice([200, 204, 404, 500])} {rng.randrange(1000, 99999)}us"
+    )
+
+
+def git_log_line(rng):
+    """A coloured `git log --graph --oneline` line."""
+    graph = rng.choice(["* ", "| * ", "* | ", "|/  ", "|\\  "])
+    refs = " \033[33m(\033[1;36mHEAD -> \033[1;32mmain\033[33m)\033[0m" if rng.random() < 0.05 else ""
+    subject = " ".join(rng.choice(["fix", "add", "refactor", "bump", "parser", "tests", "docs"]) for _ in range(5))
+    return f"\033[31m{graph}\033[0m\033[33m{hex_hash(rng, rng.choice([7, 12, 40]))}\033[0m{refs} {subject} v{rng.randrange(10)}.{rng.randrange(20)}.{rng.randrange(50)}"
+
+
+def build_corpus(make_line, lines, seed=SEED):
+    """Join lines from make_line, cut to the screen width as tmux would."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(lines):
+        line = make_line(rng)
+        visible = colors.strip_ansi(line)
+        if len(visible) > SCREEN_COLS:
+            line = visible[:SCREEN_COLS]
+        out.append(line)
+    return "\n".join(out)
+
+
+def mixed_line(rng):
+    return rng.choice([compiler_line, log_line, git_log_line])(rng)
+
+
+CORPORA = {
+    "compiler": lambda: build_corpus(compiler_line, SCREEN_ROWS),
+    "iplog": lambda: build_corpus(log_line, SCREEN_ROWS),
+    "gitlog": lambda: build_corpus(git_log_line, SCREEN_ROWS),
+    "scrollback": lambda: build_corpus(mixed_line, SCROLLBACK_LINES),
+}
+SCREEN_CORPORA = ("compiler", "iplog", "gitlog")  # Viewport sized, for drawing and keys
+
+
+# Harness
+
+def timeit(func, runs, setup=None):
+    """Return per-run durations in microseconds; setup's result is passed to func untimed."""
+    durations = []
+    for _ in range(runs):
+        arg = setup() if setup else None
+        start = time.perf_counter_ns()
+        func(arg)
+        durations.append((time.perf_counter_ns() - start) / 1000)
+    return durations
+
+
+def summarize(durations):
+    ordered = sorted(durations)
+    return {
+        "runs": len(ordered),
+        "median_us": round(statistics.median(ordered), 2),
+        "p95_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "min_us": round(ordered[0], 2),
+    }
+
+
+class PtyHarness:
+    """A pty pair whose master side is drained in the background."""
+
+    def __init__(self):
+        self.master, self.slave = pty.openpty()
+        self.slave_path = os.ttyname(self.slave)
+        self.reader = threading.Thread(target=self._drain, daemon=True)
+        self.reader.start()
+
+    def _drain(self):
+        while True:
+            try:
+                data = os.read(self.master, 65536)
+            except OSError:
+                return
+            if not data:
+                return
+
+    def send(self, keys):
+        os.write(self.master, keys.encode())
+
+    def close(self):
+        os.close(self.slave)
+        os.close(self.master)
+
+
+class WaitingTTY(colors.TTY):
+    """TTY that signals each time select_match comes back for keys, and counts what it writes."""
+
+    def __init__(self, tty_path):
+        super().__init__(tty_path)
+        self.waiting = threading.Event()
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data.encode() if isinstance(data, str) else data)
+        super().write(data)
+
+    def read_keys(self, wake_fd=None):
+        self.waiting.set()
+        return super().read_keys(wake_fd)
+
+
+def bench_keys(colored, matches, labels, rounds):
+    """Time key to finished redraw for select_match through a pty; return (durations, bytes written).
+
+    Each round starts select_match afresh (untimed), types the first character of a
+    multi-character label, which narrows and redraws the overlay, then cancels.
+    """
+    prefix = next((label[0] for label in labels if len(label) > 1), None)
+    if prefix is None:
+        return [], []
+    harness = PtyHarness()
+    durations = []
+    written = []
+    try:
+        with WaitingTTY(harness.slave_path) as tty:
+            tty.enter_raw_mode()
+            for _ in range(rounds):
+                tty.waiting.clear()
+                thread = threading.Thread(target=colors.select_match, args=(tty, colored, matches, labels), daemon=True)
+                thread.start()
+                tty.waiting.wait()
+                tty.waiting.clear()
+                start = time.perf_counter_ns()
+                written_before = tty.written
+                harness.send(prefix)
+                tty.waiting.wait()
+                durations.append((time.perf_counter_ns() - start) / 1000)
+                written.append(tty.written - written_before)
+                harness.send("\x1b")
+                thread.join()
+    finally:
+        harness.close()
+    return durations, written
+
+
+def run_benchmarks(selected, runs):
+    """Run every benchmark whose name contains selected; return {name: summary}."""
+    results = {}
+
+    def record(name, durations):
+        if durations:
+            results[name] = summarize(durations)
+            print(f"{name:40} median {results[name]['median_us']:>12.1f}us  p95 {results[name]['p95_us']:>12.1f}us", file=sys.stderr)
+
+    for corpus_name, build in CORPORA.items():
+        colored = build()
+        plain = colors.strip_ansi(colored)
+        matches = colors.find_patterns(plain)
+        priority = colors.match_priority(matches, plain, (0, 0))
+        labels = colors.generate_labels_for_matches(matches, priority)
+        corpus_runs = max(3, runs // 20) if corpus_name == "scrollback" else runs
+
+        def wanted(bench):
+            return selected in f"{bench}/{corpus_name}"
+
+        if wanted("find_patterns"):
+            record(f"find_patterns/{corpus_name}", timeit(lambda _: colors.find_patterns(plain), corpus_runs))
+        if wanted("labels"):
+            record(f"labels/{corpus_name}", timeit(
+                lambda _: colors.generate_labels_for_matches(matches, colors.match_priority(matches, plain, (0, 0))),
+                corpus_runs,
+            ))
+        if corpus_name not in SCREEN_CORPORA:
+            continue
+
+        if wanted("draw_screen"):
+            harness = PtyHarness()
+            try:
+                with colors.TTY(harness.slave_path) as tty:
+                    record(f"draw_screen_full/{corpus_name}", timeit(
+                        lambda frame: colors.draw_screen(tty, frame, matches, labels), runs,
+                        setup=lambda: colors.Frame(colored, matches),
+                    ))
+                    # Diff repaint: drop the labels of every other match
+                    frame = colors.Frame(colored, matches)
+                    colors.draw_screen(tty, frame, matches, labels)
+                    fewer = (matches[::2], labels[::2])
+
+                    def repaint(_):
+                        colors.draw_screen(tty, frame, *fewer)
+                        colors.draw_screen(tty, frame, matches, labels)
+
+                    record(f"draw_screen_diff/{corpus_name}", timeit(repaint, runs))
+            finally:
+                harness.close()
+        if wanted("select_match"):
+            name = f"select_match_key/{corpus_name}"
+            durations, written = bench_keys(colored, matches, labels, runs)
+            record(name, durations)
+            if written:
+                results[name]["bytes_per_key"] = statistics.median(written)
+                print(f"{name:40} {results[name]['bytes_per_key']:>12.0f} bytes written per key", file=sys.stderr)
+    return results
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change in median against baseline; return the names that regressed."""
+    regressed = []
+    for name, summary in results.items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        change = summary["median_us"] / before["median_us"] - 1
+        flag = ""
+        if change > threshold:
+            regressed.append(name)
+            flag = "  REGRESSED"
+        print(f"{name:40} {before['median_us']:>12.1f}us -> {summary['median_us']:>12.1f}us  {change:+7.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark colors.py hot paths")
+    parser.add_argument("--filter", default="", metavar="SUBSTR", help="Only run benchmarks whose name contains SUBSTR")
+    parser.add_argument("--runs", type=int, default=200, help="Timed runs per benchmark (fewer for the scrollback corpus)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, metavar="FILE", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Median slowdown that counts as a regression")
+    parser.add_argument("--save", action="store_true", help="Save these results as the baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.filter, args.runs)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(json.dumps(report, indent=2))
+        print(f"No baseline at {args.baseline}; run with --save to create one", file=sys.stderr)
+        return 0
+    return 1 if compare(results, baseline, args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
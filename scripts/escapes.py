@@ -0,0 +1,74 @@
+"""
+WezTerm escape sequences (OSC 52 clipboard, OSC 777 notify, SetUserVar) for colors.py and wezterm.py.
+
+Every sequence is a precomputed prefix and suffix frame around its payload, as bytes, in
+plain and tmux passthrough form. Passthrough wraps the sequence in a DCS (ESC P tmux; ... ESC \\)
+with each ESC inside doubled. Builders return a list of buffers that write() sends with a
+single writev on a raw fd, with no string assembly or text-layer buffering in between.
+"""
+import base64
+import os
+
+ESC = b"\x1b"
+BEL = b"\a"
+ST = b"\x1b\\"
+DCS_START = b"\x1bPtmux;"
+DCS_END = ST
+CANCEL = b"\x18"  # CAN aborts an unfinished OSC string
+
+IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+
+# C0 controls and DEL would end or corrupt a sequence when they are part of its text
+_CONTROLS = dict.fromkeys([*range(0x20), 0x7f])
+
+
+def passthrough_frames(prefix, suffix):
+    """Return {passthrough: (prefix, suffix)} for a sequence framed by prefix and suffix."""
+    return {
+        False: (prefix, suffix),
+        True: (DCS_START + prefix.replace(ESC, ESC + ESC), suffix.replace(ESC, ESC + ESC) + DCS_END),
+    }
+
+
+OSC52 = passthrough_frames(b"\x1b]52;c;", BEL)
+NOTIFY = passthrough_frames(b"\x1b]777;notify;", ST)
+SET_USER_VAR = passthrough_frames(b"\x1b]1337;SetUserVar=", BEL)
+
+
+def in_tmux():
+    return "TMUX" in os.environ
+
+
+def clipboard(text, passthrough=False):
+    """Return buffers that copy text (str or bytes) to the clipboard."""
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    prefix, suffix = OSC52[passthrough]
+    return [prefix, base64.b64encode(data), suffix]
+
+
+def notify(message, title="Notification", passthrough=False):
+    """Return buffers for a desktop notification; controls in the text are dropped.
+
+    message and title may be any value (e.g. a null from a JSON payload) and are shown as str().
+    """
+    body = f"{str(title).translate(_CONTROLS)};{str(message).translate(_CONTROLS)}".encode("utf-8")
+    prefix, suffix = NOTIFY[passthrough]
+    return [prefix, body, suffix]
+
+
+def user_var(name, value, passthrough=False):
+    """Return buffers that set the WezTerm user var name to value."""
+    prefix, suffix = SET_USER_VAR[passthrough]
+    return [prefix, name.encode("utf-8") + b"=" + base64.b64encode(value.encode("utf-8")), suffix]
+
+
+def write(fd, buffers):
+    """Write every buffer to fd with writev, continuing after partial writes."""
+    buffers = [memoryview(b) for b in buffers if b]
+    while buffers:
+        written = os.writev(fd, buffers[:IOV_MAX])
+        while buffers and written >= len(buffers[0]):
+            written -= len(buffers[0])
+            buffers.pop(0)
+        if buffers and written:
+            buffers[0] = buffers[0][written:]
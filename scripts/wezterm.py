@@ -2,57 +2,232 @@
 
 import os
 import sys
+import atexit
 import base64
+import contextlib
 import subprocess
 import time
 import json
+import socket
+import stat
+from collections import namedtuple
 from datetime import datetime
 
+import escapes
+
 DEBUG = os.environ.get('DEBUG_WEZTERM') == '1'
 LOG_PATH = '/tmp/wezterm-logs'
+TIMINGS_PATH = f"{LOG_PATH}/timings.jsonl"
+
+SHELLS = ("bash", "zsh", "fish", "sh")
+PROC_AVAILABLE = os.path.isdir("/proc/self")
+
+# Device majors for tty_nr in /proc/<pid>/stat
+TTY_MAJOR = 4  # /dev/ttyN, /dev/ttySN from minor 64
+UNIX98_PTY_MAJOR = 136  # /dev/pts/N, spread over 8 majors of 256 minors
+
+ProcInfo = namedtuple("ProcInfo", "comm ppid tty_nr starttime")
+
+TTY_CACHE_NAME = "tty-cache.json"
+TTY_CACHE_MAX_ENTRIES = 64
+
+# Clipboard payloads are read and base64-encoded a chunk at a time. The chunk size is a
+# multiple of 3 so the encoded chunks join into one valid base64 string, and each one is
+# also its own tmux passthrough packet, well under tmux's 1MB limit on a DCS string.
+CLIPBOARD_CHUNK_SIZE = 48 * 1024
+CLIPBOARD_MAX_BYTES = 8 * 1024 * 1024  # Default cap; $WEZTERM_CLIPBOARD_MAX overrides it
+
+# Notifier daemon (--notifier)
+NOTIFIER_SOCKET_NAME = "wezterm-notify.sock"
+NOTIFIER_TIMEOUT = 1.0
+COALESCE_WINDOW = 10.0  # A repeat of a notification within this many seconds is dropped
+TITLE_INTERVAL = 3.0  # At most one notification per title (and TTY) this often; the rest are merged
+TTY_IDLE_SECONDS = 300.0  # Close TTYs nothing was sent to for this long
+
+OPERATIONS = ("clipboard", "notify", "open", "codex")
+
+# With DEBUG_WEZTERM=1, log lines and timing spans are buffered and written by flush_log,
+# at exit (or per request in the notifier), so the logging doesn't skew what it measures
+log_lines = []
+timings = []
+run_info = {"operation": None, "caller": None, "start": time.perf_counter_ns()}
+NO_SPAN = contextlib.nullcontext()
 
 def log(msg):
-    if not DEBUG:
+    if DEBUG:
+        log_lines.append((time.time(), msg))
+
+@contextlib.contextmanager
+def _timed(name):
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        timings.append((name, (time.perf_counter_ns() - start) / 1e6))
+
+def span(name):
+    """Time a block as name for the timings summary; a no-op unless DEBUG."""
+    return _timed(name) if DEBUG else NO_SPAN
+
+def calling_command():
+    """Return the command name of the first ancestor that isn't a shell."""
+    pid = os.getppid()
+    for _ in range(8):
+        info = read_proc_info(pid)
+        cmd_name = info.comm if info else get_command_name(pid)
+        if not is_shell(cmd_name) or not info:
+            return cmd_name
+        pid = info.ppid
+    return None
+
+def caller_name():
+    """Return calling_command() for timings records, once, and without timing its lookups."""
+    if run_info["caller"] is None:
+        count = len(timings)
+        run_info["caller"] = calling_command()
+        del timings[count:]
+    return run_info["caller"]
+
+def flush_log():
+    """Write buffered log lines, and one timings record for the run so far."""
+    if not log_lines and not timings:
         return
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    total = (time.perf_counter_ns() - run_info["start"]) / 1e6
+    log(f"Completed {run_info['operation']} in {total:.3f}ms")
     try:
         os.makedirs(LOG_PATH, exist_ok=True)
+        if timings:
+            spans = [[name, round(ms, 3)] for name, ms in timings]
+            record = {
+                "time": time.time(), "operation": run_info["operation"], "caller": caller_name(),
+                "total_ms": round(total, 3), "spans": spans,
+            }
+            with open(TIMINGS_PATH, "a") as f:
+                f.write(json.dumps(record) + "\n")
         with open(f"{LOG_PATH}/debug.log", "a") as f:
-            f.write(f"{timestamp} {msg}\n")
+            f.write("".join(
+                f"{datetime.fromtimestamp(when).strftime('%Y-%m-%d %H:%M:%S.%f')} {msg}\n"
+                for when, msg in log_lines
+            ))
     except Exception as e:
         print(f"Failed to write log: {e}", file=sys.stderr)
+    log_lines.clear()
+    timings.clear()
+    run_info["start"] = time.perf_counter_ns()
 
-def write_clipboard(tty_file, text):
-    """Write OSC-52 escape sequences to copy text into clipboard."""
-    log(f"Writing to clipboard, text length: {len(text)}")
+if DEBUG:
+    atexit.register(flush_log)
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def print_timings(path=TIMINGS_PATH):
+    """Summarize recorded runs: percentiles per span (summed within a run) and per caller."""
+    per_span, per_caller = {}, {}
+    try:
+        f = open(path)
+    except OSError as e:
+        print(f"No timings to summarize: {e} (record some with DEBUG_WEZTERM=1)", file=sys.stderr)
+        return 1
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            run_spans = {}
+            for name, ms in record["spans"]:
+                run_spans[name] = run_spans.get(name, 0) + ms
+            for name, ms in run_spans.items():
+                per_span.setdefault(name, []).append(ms)
+            key = f"{record['caller']} {record['operation']}"
+            per_caller.setdefault(key, []).append(record["total_ms"])
+
+    for heading, groups in (("span", per_span), ("caller operation", per_caller)):
+        print(f"{heading:32} {'runs':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, values in sorted(groups.items(), key=lambda item: -percentile(sorted(item[1]), 0.5)):
+            ordered = sorted(values)
+            print(
+                f"{name:32} {len(ordered):>6} {percentile(ordered, 0.5):>9.3f} {percentile(ordered, 0.9):>9.3f}"
+                f" {percentile(ordered, 0.99):>9.3f} {ordered[-1]:>9.3f}"
+            )
+        print()
+
+def clipboard_passthrough():
+    """Return True if OSC-52 has to be wrapped for tmux (or screen) passthrough."""
     in_tmux = "TMUX" in os.environ
     term = os.environ.get("TERM", "")
     in_screen_or_tmux = term.startswith("screen") or term.startswith("tmux")
     log(f"Terminal state: tmux={in_tmux}, term={term}")
+    return in_tmux or in_screen_or_tmux
 
-    encoded = base64.b64encode(text.encode("utf-8")).decode("utf-8")
-    if in_tmux or in_screen_or_tmux:
-        sequence = f"\x1bPtmux;\x1b\x1b]52;c;{encoded}\a\x1b\\"
-    else:
-        sequence = f"\x1b]52;c;{encoded}\a"
-    
-    log(f"Writing sequence (length: {len(sequence)})")
-    tty_file.write(sequence)
-    tty_file.flush()
-
-def send_notification(tty_file, message, title="Notification"):
-    """Write WezTerm's notify escape sequence."""
-    log(f"Sending notification: {message}")
-    in_tmux = "TMUX" in os.environ
+def clipboard_max_bytes():
+    """Return the clipboard payload cap: $WEZTERM_CLIPBOARD_MAX, or the default if unset or bad."""
+    value = os.environ.get("WEZTERM_CLIPBOARD_MAX")
+    if value is None:
+        return CLIPBOARD_MAX_BYTES
+    try:
+        return int(value)
+    except ValueError:
+        log(f"Ignoring WEZTERM_CLIPBOARD_MAX={value!r}, using {CLIPBOARD_MAX_BYTES}")
+        return CLIPBOARD_MAX_BYTES
+
+def clipboard_sequence(text):
+    """Return the buffers of the OSC-52 escape sequence that copies text into the clipboard."""
+    log(f"Writing to clipboard, text length: {len(text)}")
+    data = text.encode("utf-8")
+    max_bytes = clipboard_max_bytes()
+    if len(data) > max_bytes:
+        raise ValueError(f"clipboard text is {len(data)} bytes, over the {max_bytes} byte cap")
+    return escapes.clipboard(data, clipboard_passthrough())
+
+def stream_clipboard(fd, source, max_bytes=None):
+    """Copy everything read from the binary file source into the clipboard.
 
-    if in_tmux:
-        tty_file.write(f"\x1bPtmux;\x1b\x1b]777;notify;{title};{message}\x1b\\")
+    The payload is encoded and written to fd a chunk at a time, so memory stays flat
+    however large it is. Under tmux every chunk goes in its own DCS passthrough packet;
+    the outer terminal sees one continuous OSC-52. Returns False, and cancels the
+    sequence, if the payload is larger than max_bytes (default: clipboard_max_bytes()).
+    """
+    if max_bytes is None:
+        max_bytes = clipboard_max_bytes()
+    start, end = escapes.OSC52[False]
+    if clipboard_passthrough():
+        head, tail = escapes.DCS_START, escapes.DCS_END
+        start = start.replace(escapes.ESC, escapes.ESC + escapes.ESC)
     else:
-        tty_file.write(f"\x1b]777;notify;{title};{message}\x1b\\")
+        head = tail = b""
 
-    tty_file.flush()
+    total = 0
+    frame = [head, start, b"", tail]
+    while True:
+        chunk = source.read(CLIPBOARD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            log(f"Clipboard payload over {max_bytes} bytes, cancelling")
+            if frame[1] != start:
+                escapes.write(fd, [head, escapes.CANCEL, tail])
+            return False
+        with span("encode"):
+            frame[2] = base64.b64encode(chunk)
+        with span("write"):
+            escapes.write(fd, frame)
+        frame[1] = b""
+    with span("write"):
+        escapes.write(fd, [head, frame[1], end, tail])
+    log(f"Streamed {total} bytes to clipboard")
+    return True
 
-def codex_notification(tty_file, text):
+def notification_sequence(message, title="Notification", in_tmux=None):
+    """Return the buffers of WezTerm's notify sequence; in_tmux defaults to our environment."""
+    log(f"Sending notification: {message}")
+    if in_tmux is None:
+        in_tmux = escapes.in_tmux()
+    return escapes.notify(message, title, in_tmux)
+
+def codex_sequence(text):
     """
     data = {
       "type": "agent-turn-complete",
@@ -64,29 +239,54 @@ def codex_notification(tty_file, text):
     }
     """
     data = json.loads(text)
-    send_notification(tty_file, data["last-assistant-message"], title="Codex")
+    return notification_sequence(data["last-assistant-message"], title="Codex")
 
 
-def set_user_var(tty_file, value):
-    """Write WezTerm's SetUserVar escape sequence."""
+def user_var_sequence(value):
+    """Return the buffers of WezTerm's SetUserVar sequence."""
     log(f"Setting user var: {value}")
-    var_name = "open-web"
-    encoded_value = base64.b64encode(value.encode("utf-8")).decode("utf-8")
-    in_tmux = "TMUX" in os.environ
+    return escapes.user_var("open-web", value, escapes.in_tmux())
 
-    if in_tmux:
-        tty_file.write(f"\x1bPtmux;\x1b\x1b]1337;SetUserVar={var_name}={encoded_value}\x07\x1b\\")
-    else:
-        tty_file.write(f"\x1b]1337;SetUserVar={var_name}={encoded_value}\x07")
+def build_sequence(operation, text, title=None):
+    """Return the escape sequence buffers for one operation; ValueError if it's unknown."""
+    if operation == "clipboard":
+        return clipboard_sequence(text)
+    if operation == "notify":
+        return notification_sequence(text, title=title or "Notification")
+    if operation == "open":
+        return user_var_sequence(text)
+    if operation == "codex":
+        return codex_sequence(text)
+    raise ValueError(f"Unknown operation: {operation}")
 
-    tty_file.flush()
+def read_batch(lines):
+    """Encode newline-delimited JSON operations; return (buffers, errors).
+
+    Each line is {"operation": ..., "text": ..., "title": ...} with title optional.
+    A bad line becomes an error and the rest of the batch carries on.
+    """
+    buffers, errors = [], []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            op = json.loads(line)
+            if not isinstance(op, dict) or not isinstance(op.get("text"), str):
+                raise ValueError('expected {"operation": ..., "text": "..."}')
+            buffers += build_sequence(op.get("operation"), op["text"], op.get("title"))
+        except KeyError as e:
+            errors.append(f"line {number}: missing {e}")
+        except (ValueError, TypeError) as e:
+            errors.append(f"line {number}: {e}")
+    return buffers, errors
 
 def get_command_name(pid):
     """Return the command name of the process with the given PID."""
     log(f"Getting command name for PID: {pid}")
     try:
         cmd = ["ps", "-p", str(pid), "-o", "comm="]
-        result = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
+        with span("ps comm"):
+            result = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
         log(f"Command for PID {pid}: {result}")
         return result
     except subprocess.SubprocessError as e:
@@ -98,7 +298,8 @@ def get_ppid(pid):
     log(f"Getting parent PID for: {pid}")
     try:
         cmd = ["ps", "-p", str(pid), "-o", "ppid="]
-        ppid = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
+        with span("ps ppid"):
+            ppid = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
         result = int(ppid)
         log(f"Parent of PID {pid} is: {result}")
         return result
@@ -111,7 +312,8 @@ def get_tty_from_pid(pid):
     log(f"Getting TTY for PID: {pid}")
     try:
         cmd = ["ps", "-p", str(pid), "-o", "tty="]
-        tty = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
+        with span("ps tty"):
+            tty = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
         if tty and "?" not in tty:
             result = f"/dev/{tty}"
             log(f"TTY for PID {pid}: {result}")
@@ -121,56 +323,472 @@ def get_tty_from_pid(pid):
         log(f"Failed to get TTY for PID {pid}: {e}")
     return None
 
+def read_proc_info(pid):
+    """Return the ProcInfo for a PID from /proc/<pid>/stat, or None without /proc."""
+    if not PROC_AVAILABLE:
+        return None
+    try:
+        with span("proc stat"), open(f"/proc/{pid}/stat", "rb") as f:
+            proc_stat = f.read()
+    except OSError as e:
+        log(f"Failed to read /proc stat for PID {pid}: {e}")
+        return None
+    # comm is in parentheses and may itself contain spaces or parentheses
+    open_paren, close_paren = proc_stat.index(b"("), proc_stat.rindex(b")")
+    fields = proc_stat[close_paren + 2:].split()
+    info = ProcInfo(
+        proc_stat[open_paren + 1:close_paren].decode(errors="replace"),
+        int(fields[1]),
+        int(fields[4]),
+        int(fields[19]),
+    )
+    log(f"PID {pid}: {info}")
+    return info
+
+def decode_tty_nr(tty_nr):
+    """Return the device path for a stat tty_nr, or None if it has none we know."""
+    major = (tty_nr >> 8) & 0xfff
+    minor = (tty_nr & 0xff) | ((tty_nr >> 12) & 0xfff00)
+    if UNIX98_PTY_MAJOR <= major < UNIX98_PTY_MAJOR + 8:
+        return f"/dev/pts/{(major - UNIX98_PTY_MAJOR) * 256 + minor}"
+    if major == TTY_MAJOR:
+        return f"/dev/tty{minor}" if minor < 64 else f"/dev/ttyS{minor - 64}"
+    return None
+
+def is_shell(cmd_name):
+    return bool(cmd_name) and any(cmd_name.endswith(s) or cmd_name == s for s in SHELLS)
+
 def find_parent_shell_tty():
-    """Find TTY from parent shell process (bash/zsh/fish)."""
+    """Find TTY from parent shell process (bash/zsh/fish).
+
+    On Linux each ancestor is read once from /proc; elsewhere, or if /proc can't be
+    read, this falls back to ps.
+    """
     log("Searching for parent shell TTY")
-    shells = ("bash", "zsh", "fish", "sh")
     pid = os.getppid()
     while pid and pid > 1:
         log(f"Checking PID: {pid}")
-        cmd_name = get_command_name(pid)
-        if cmd_name and any(cmd_name.endswith(s) or cmd_name == s for s in shells):
-            tty = get_tty_from_pid(pid)
+        info = read_proc_info(pid)
+        cmd_name = info.comm if info else get_command_name(pid)
+        if is_shell(cmd_name):
+            tty = None
+            if info is None:
+                tty = get_tty_from_pid(pid)
+            elif info.tty_nr:
+                # ps knows device names we don't decode
+                tty = decode_tty_nr(info.tty_nr) or get_tty_from_pid(pid)
             if tty and os.path.exists(tty):
                 log(f"Found shell {cmd_name} TTY: {tty}")
                 return tty
-        pid = get_ppid(pid)
+        pid = info.ppid if info else get_ppid(pid)
     log("No parent shell TTY found")
     return None
 
+def read_ps_info(pid):
+    """Return a ProcInfo for a PID from a single ps call, for when /proc can't be read.
+
+    tty_nr is the terminal's name (0 without one) and starttime the ps lstart string;
+    both are only compared, never decoded.
+    """
+    log(f"Getting process info for PID: {pid}")
+    try:
+        cmd = ["ps", "-p", str(pid), "-o", "ppid=,tty=,lstart=,comm="]
+        with span("ps info"):
+            fields = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().split(None, 7)
+        tty = fields[1]
+        return ProcInfo(fields[7].strip(), int(fields[0]), 0 if "?" in tty else tty, " ".join(fields[2:7]))
+    except (subprocess.SubprocessError, ValueError, IndexError) as e:
+        log(f"Failed to get process info for PID {pid}: {e}")
+        return None
+
+def caller_process():
+    """Return (pid, start time, terminal) of the process that called us, or None.
+
+    Shell wrappers are skipped: nvim and lazygit run us through a fresh `sh -c` every
+    time (detached from the terminal, for background jobs), so the caller is the first
+    ancestor that isn't a shell. A shell on a terminal its parent isn't on (an
+    interactive shell in a tmux pane) is the caller itself.
+    """
+    pid = os.getppid()
+    info = read_proc_info(pid) or read_ps_info(pid)
+    for _ in range(8):
+        if info is None or not is_shell(info.comm):
+            break
+        parent = read_proc_info(info.ppid) or read_ps_info(info.ppid)
+        if parent is None or (info.tty_nr and parent.tty_nr != info.tty_nr):
+            break
+        pid, info = info.ppid, parent
+    return (pid, str(info.starttime), info.tty_nr) if info else None
+
+def runtime_dir():
+    """Return $XDG_RUNTIME_DIR, or a directory under /tmp that only we can access."""
+    path = os.environ.get("XDG_RUNTIME_DIR")
+    if not path:
+        path = f"/tmp/wezterm-{os.getuid()}"
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+def tty_cache_path():
+    return os.path.join(runtime_dir(), TTY_CACHE_NAME)
+
+def load_tty_cache():
+    """Return the resolution cache, {"<pid>:<start time>": [tty path, device number]}."""
+    try:
+        with open(tty_cache_path()) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def cached_tty(cache, key):
+    """Return the cached TTY for key if it is still the same character device."""
+    entry = cache.get(key)
+    if not entry:
+        return None
+    path, rdev = entry
+    try:
+        st = os.stat(path)
+    except OSError:
+        log(f"Cached TTY {path} is gone")
+        return None
+    if not stat.S_ISCHR(st.st_mode) or st.st_rdev != rdev:
+        log(f"Cached TTY {path} is a different device now")
+        return None
+    return path
+
+def store_tty(cache, key, path):
+    """Save path for key, keeping the most recently stored entries."""
+    try:
+        cache.pop(key, None)
+        cache[key] = [path, os.stat(path).st_rdev]
+        for old_key in list(cache)[:-TTY_CACHE_MAX_ENTRIES]:
+            del cache[old_key]
+        tmp_path = f"{tty_cache_path()}.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, tty_cache_path())
+    except OSError as e:
+        log(f"Failed to save TTY cache: {e}")
+
+def controlling_tty_path():
+    """Return the device path of our controlling terminal from /proc, or None.
+
+    Without /proc this doesn't fork ps for it; callers fall back to "/dev/tty".
+    """
+    info = read_proc_info(os.getpid())
+    return decode_tty_nr(info.tty_nr) if info and info.tty_nr else None
+
 def get_target_tty():
-    """Get target TTY path."""
-    log("Getting target TTY")
+    """Get target TTY path: our controlling terminal, else a parent shell's.
 
-    # First try /dev/tty if it's available
+    Opening /dev/tty costs nothing, so only the parent-shell walk (a ps per ancestor
+    without /proc) is cached. Its results are kept per caller (see caller_process),
+    keyed by the caller's PID and start time plus our own terminal, so editors and
+    lazygit calling us repeatedly only walk once. The key can only match while that
+    same caller is alive, and the entry is only used while its path is still the same
+    device.
+    """
+    with span("resolve tty"):
+        return _get_target_tty()
+
+def _get_target_tty():
+    log("Getting target TTY")
     try:
-        with open("/dev/tty", "w") as f:
+        # Name the device behind /dev/tty where that's free, so the notifier can open it
+        with open("/dev/tty", "w"):
             log("Using /dev/tty")
-            return "/dev/tty"
-    except (OSError, IOError):
+            return controlling_tty_path() or "/dev/tty"
+    except OSError:
         log("/dev/tty not available")
 
+    # A caller without a terminal (e.g. tmux's server) runs commands for any pane, so
+    # its resolutions differ from call to call and are not cached
+    caller = caller_process()
+    key = None
+    if caller and caller[2]:
+        own = read_proc_info(os.getpid()) or read_ps_info(os.getpid())
+        key = f"{caller[0]}:{caller[1]}:{own.tty_nr if own else 0}"
+    cache = load_tty_cache() if key else {}
+
+    tty = cached_tty(cache, key)
+    if tty:
+        log(f"Using cached TTY: {tty}")
+        return tty
+
     # Walk up parent chain to find a shell with TTY
-    shell_tty = find_parent_shell_tty()
-    if shell_tty:
-        log(f"Using shell TTY: {shell_tty}")
-        return shell_tty
+    tty = find_parent_shell_tty()
+    if not tty:
+        log("No TTY found")
+        return None
+    log(f"Using shell TTY: {tty}")
+    if key:
+        store_tty(cache, key, tty)
+    return tty
 
-    log("No TTY found")
-    return None
+def notifier_socket_path():
+    return os.path.join(runtime_dir(), NOTIFIER_SOCKET_NAME)
+
+def send_to_notifier(tty_path, operation, text, title=None):
+    """Hand a notification to a running notifier. Returns False if none is listening."""
+    request = {
+        "tty": tty_path, "operation": operation, "text": text, "title": title,
+        "tmux": "TMUX" in os.environ, "caller": caller_name() if DEBUG else None,
+    }
+    try:
+        with span("notifier send"), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(NOTIFIER_TIMEOUT)
+            sock.connect(notifier_socket_path())
+            sock.sendall(json.dumps(request).encode() + b"\n")
+    except OSError as e:
+        log(f"No notifier: {e}")
+        return False
+    log("Handed to notifier")
+    return True
+
+class Notifier:
+    """Merges and rate-limits notifications, writing them to TTYs it keeps open."""
+
+    def __init__(self):
+        self.ttys = {}  # path -> [fd, last used]
+        self.sent = {}  # (tty, title, message) -> when it was last shown
+        self.titles = {}  # (tty, title) -> [last sent, pending messages, in tmux]
+
+    def submit(self, request, now):
+        """Queue or send one client request; ValueError/KeyError if it is malformed."""
+        operation, text = request["operation"], request["text"]
+        if operation == "codex":
+            message, title = json.loads(text)["last-assistant-message"], "Codex"
+        elif operation == "notify":
+            message, title = text, request.get("title") or "Notification"
+        else:
+            raise ValueError(f"Unknown operation: {operation}")
+        key = (request["tty"], title)
+
+        if now - self.sent.get((*key, message), -COALESCE_WINDOW) < COALESCE_WINDOW:
+            log(f"Dropping repeated notification: {title}: {message}")
+            return
+        state = self.titles.setdefault(key, [-TITLE_INTERVAL, [], False])
+        state[2] = bool(request.get("tmux"))
+        if message in state[1]:
+            return
+        state[1].append(message)
+        if now - state[0] >= TITLE_INTERVAL:
+            self.send(key, now)
+
+    def send(self, key, now):
+        """Write the pending messages for key as one notification."""
+        state = self.titles[key]
+        messages, state[1] = state[1], []
+        state[0] = now
+        for message in messages:
+            self.sent[(*key, message)] = now
+        message = messages[0] if len(messages) == 1 else f"{messages[0]} (+{len(messages) - 1} more)"
+        with span("encode"):
+            buffers = notification_sequence(message, key[1], in_tmux=state[2])
+        self.write(key[0], buffers, now)
+
+    def write(self, tty_path, buffers, now):
+        """Write buffers to tty_path, reopening it once if the held descriptor went bad."""
+        for attempt in range(2):
+            try:
+                fd = self.open_tty(tty_path, now)
+                with span("write"):
+                    escapes.write(fd, buffers)
+                return
+            except OSError as e:
+                log(f"Error writing to {tty_path}: {e}")
+                self.close_tty(tty_path)
+
+    def open_tty(self, tty_path, now):
+        entry = self.ttys.get(tty_path)
+        if entry is None:
+            fd = os.open(tty_path, os.O_WRONLY | os.O_NOCTTY | os.O_NONBLOCK)
+            if not stat.S_ISCHR(os.fstat(fd).st_mode):
+                os.close(fd)
+                raise OSError(f"{tty_path} is not a terminal")
+            entry = self.ttys[tty_path] = [fd, now]
+        entry[1] = now
+        return entry[0]
+
+    def close_tty(self, tty_path):
+        entry = self.ttys.pop(tty_path, None)
+        if entry is not None:
+            os.close(entry[0])
+
+    def flush_due(self, now):
+        """Send merged notifications whose title interval has passed."""
+        for key, state in list(self.titles.items()):
+            if state[1] and now - state[0] >= TITLE_INTERVAL:
+                self.send(key, now)
+
+    def next_deadline(self, now):
+        """Return when flush_due next has work, or when idle TTYs should be closed."""
+        deadlines = [state[0] + TITLE_INTERVAL for state in self.titles.values() if state[1]]
+        deadlines += [used + TTY_IDLE_SECONDS for _, used in self.ttys.values()]
+        return min(deadlines, default=None)
+
+    def prune(self, now):
+        """Forget expired history and close idle TTYs."""
+        self.sent = {key: when for key, when in self.sent.items() if now - when < COALESCE_WINDOW}
+        self.titles = {
+            key: state for key, state in self.titles.items()
+            if state[1] or now - state[0] < TITLE_INTERVAL
+        }
+        for tty_path, (_, used) in list(self.ttys.items()):
+            if now - used >= TTY_IDLE_SECONDS:
+                log(f"Closing idle TTY {tty_path}")
+                self.close_tty(tty_path)
+
+def notifier_alive(path):
+    """Return True if something accepts connections on path."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+def run_notifier():
+    """Notifier mode: serve notify and codex requests from clients over a Unix socket."""
+    path = notifier_socket_path()
+    if notifier_alive(path):
+        print(f"Notifier already listening on {path}", file=sys.stderr)
+        return 1
+    try:
+        os.unlink(path)  # Stale socket from a notifier that died
+    except FileNotFoundError:
+        pass
+
+    notifier = Notifier()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(path)
+        os.chmod(path, 0o600)
+        server.listen()
+        log(f"Notifier listening on {path}")
+        try:
+            while True:
+                # Sends that come due are timed as their own record, from here
+                run_info.update(operation="notifier flush", caller="notifier", start=time.perf_counter_ns())
+                now = time.monotonic()
+                notifier.flush_due(now)
+                notifier.prune(now)
+                flush_log()
+                deadline = notifier.next_deadline(now)
+                server.settimeout(None if deadline is None else max(0.0, deadline - now))
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                run_info["start"] = time.perf_counter_ns()  # Not counting the wait for a client
+                with conn:
+                    conn.settimeout(NOTIFIER_TIMEOUT)
+                    try:
+                        request = json.loads(conn.makefile("rb").readline())
+                        run_info["operation"] = f"notifier {request.get('operation')}"
+                        run_info["caller"] = request.get("caller") or "unknown"
+                        notifier.submit(request, time.monotonic())
+                    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                        log(f"Notifier request failed: {e}")
+                flush_log()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+    return 0
+
+def run_clipboard_stream(path=None):
+    """Copy stdin, or the file at path, to the clipboard without holding it in memory."""
+    try:
+        source = open(path, "rb") if path else sys.stdin.buffer
+    except OSError as e:
+        print(f"Error reading {path}: {e}", file=sys.stderr)
+        return 1
+
+    tty_path = get_target_tty()
+    if not tty_path:
+        log("No TTY available, skipping")
+        return 0
+    log(f"Using TTY: {tty_path}")
+
+    try:
+        with source:
+            fd = os.open(tty_path, os.O_WRONLY | os.O_NOCTTY)
+            try:
+                copied = stream_clipboard(fd, source)
+            finally:
+                os.close(fd)
+    except OSError as e:
+        log(f"Error copying to {tty_path}: {e}")
+        print(f"Error copying to {tty_path}: {e}", file=sys.stderr)
+        return 1
+    if not copied:
+        print(f"Clipboard payload is over the {clipboard_max_bytes()} byte cap (WEZTERM_CLIPBOARD_MAX)", file=sys.stderr)
+        return 1
+    return 0
+
+def run_batch():
+    """Run --batch: operations from stdin, written to the TTY in one writev."""
+    with span("encode"):
+        buffers, errors = read_batch(sys.stdin)
+    log(f"Batch: {sum(map(len, buffers))} bytes, {len(errors)} errors")
+    for error in errors:
+        log(f"Batch error: {error}")
+        print(error, file=sys.stderr)
+
+    if buffers:
+        tty_path = get_target_tty()
+        if not tty_path:
+            log("No TTY available, skipping")
+        else:
+            log(f"Using TTY: {tty_path}")
+            try:
+                fd = os.open(tty_path, os.O_WRONLY | os.O_NOCTTY)
+                try:
+                    with span("write"):
+                        escapes.write(fd, buffers)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                log(f"Error writing to {tty_path}: {e}")
+                print(f"Error writing to {tty_path}: {e}", file=sys.stderr)
+                return 1
+    return 1 if errors else 0
 
 def main():
-    start_time = time.time()
     log("Script started")
 
+    if sys.argv[1:] == ["--batch"]:
+        run_info["operation"] = "batch"
+        sys.exit(run_batch())
+    if sys.argv[1:] == ["--notifier"]:
+        sys.exit(run_notifier())
+    if sys.argv[1:2] == ["--timings"]:
+        sys.exit(print_timings(*sys.argv[2:3]))
+
     if len(sys.argv) < 3:
-        print(f"Usage: {sys.argv[0]} <clipboard|notify|open> <text> [title]")
+        print(f"Usage: {sys.argv[0]} <clipboard|notify|open|codex> <text> [title]")
+        print(f"       {sys.argv[0]} clipboard <- | --file PATH>")
+        print(f"       {sys.argv[0]} --batch < operations.ndjson")
+        print(f"       {sys.argv[0]} --notifier")
+        print(f"       {sys.argv[0]} --timings [FILE]   (summarize DEBUG_WEZTERM=1 runs)")
         sys.exit(1)
 
     operation = sys.argv[1]
+    run_info["operation"] = operation
+    if operation == "clipboard" and sys.argv[2] in ("-", "--file"):
+        if sys.argv[2] == "--file" and len(sys.argv) < 4:
+            print(f"Usage: {sys.argv[0]} clipboard --file PATH")
+            sys.exit(1)
+        run_info["operation"] = "clipboard stream"
+        sys.exit(run_clipboard_stream(sys.argv[3] if sys.argv[2] == "--file" else None))
+
     text = sys.argv[2]
     title = sys.argv[3] if len(sys.argv) > 3 else None
     log(f"Operation: {operation}, text length: {len(text)}")
+    if operation not in OPERATIONS:
+        log(f"Unknown operation: {operation}")
+        print(f"Unknown operation: {operation}")
+        sys.exit(1)
 
     tty_path = get_target_tty()
     if not tty_path:
@@ -179,27 +797,24 @@ def main():
 
     log(f"Using TTY: {tty_path}")
 
+    # A running notifier merges and rate-limits notifications; /dev/tty would be its own
+    if operation in ("notify", "codex") and tty_path != "/dev/tty":
+        if send_to_notifier(tty_path, operation, text, title):
+            return
+
     try:
-        with open(tty_path, "w") as tty_file:
-            if operation == "clipboard":
-                write_clipboard(tty_file, text)
-            elif operation == "notify":
-                send_notification(tty_file, text, title=title or "Notification")
-            elif operation == "open":
-                set_user_var(tty_file, text)
-            elif operation == "codex":
-                codex_notification(tty_file, text)
-            else:
-                log(f"Unknown operation: {operation}")
-                print(f"Unknown operation: {operation}")
-                sys.exit(1)
+        with span("encode"):
+            buffers = build_sequence(operation, text, title)
+        with span("write"):
+            fd = os.open(tty_path, os.O_WRONLY | os.O_NOCTTY)
+            try:
+                escapes.write(fd, buffers)
+            finally:
+                os.close(fd)
     except Exception as e:
         log(f"Error writing to {tty_path}: {e}")
         print(f"Error writing to {tty_path}: {e}")
         sys.exit(1)
 
-    end_time = time.time()
-    log(f"Script completed in {end_time - start_time:.3f}s")
-
 if __name__ == "__main__":
     main()